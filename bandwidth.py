@@ -0,0 +1,176 @@
+import asyncio
+import time
+from metrics import metrics
+
+# 触发限流、应当降低并发的响应状态码
+THROTTLE_STATUSES = (429, 503)
+
+
+class TokenBucket:
+    """
+    令牌桶限速器，下载和 Dropbox 上传共用，只在事件循环中使用
+
+    每传输一个字节消耗一个令牌，令牌以 rate 字节/秒的速度补充，最多积累 burst 个。
+    令牌不足时预支并等待相应的时间，因此大块数据也能按平均速率发送。
+    """
+
+    def __init__(self, rate=None, burst=None):
+        """
+        :param rate: 限速（字节/秒），为 None 或 0 时不限速
+        :param burst: 令牌桶容量，默认为一秒的流量
+        """
+        self.rate = None
+        self.burst = None
+        self.tokens = 0
+        self.updated = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        """运行中调整限速"""
+        self.rate = rate or None
+        self.burst = burst or self.rate
+        self.tokens = min(self.tokens, self.burst) if self.burst else 0
+        self.updated = time.monotonic()
+        metrics.set_gauge('bandwidth_limit_bytes_per_second', self.rate or 0)
+
+    def reserve(self, amount):
+        """
+        预支 amount 个令牌
+        :return: 需要等待的秒数
+        """
+        if not self.rate:
+            return 0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        return max(0, -self.tokens / self.rate)
+
+    async def consume(self, amount):
+        delay = self.reserve(amount)
+        if delay:
+            metrics.observe('bandwidth_wait_seconds', delay)
+            await asyncio.sleep(delay)
+
+
+class AdaptiveConcurrency:
+    """
+    根据测得的吞吐量、失败率和 429/503 响应调整下载并发数（加性增、乘性减）
+
+    每个窗口结束时：出现 429/503 时并发数减半；失败率超过 error_threshold 时减一；
+    下载名额全部占满、且上次增加带来了吞吐提升时加一。增加后吞吐没有提升则退回，
+    并在 hold_windows 个窗口内不再增加。带宽已接近限速时也不再增加。
+    """
+
+    def __init__(self, slots, min_limit=1, max_limit=8, window=10, error_threshold=0.2,
+                 hold_windows=6, limiter=None):
+        """
+        :param slots: 被调整的 PrioritySemaphore
+        :param min_limit: 并发数下限
+        :param max_limit: 并发数上限
+        :param window: 统计窗口（秒）
+        :param error_threshold: 窗口内失败率超过该值时降低并发
+        :param hold_windows: 增加无效后暂停增加的窗口数
+        :param limiter: 共享的 TokenBucket，吞吐接近其限速时不再增加并发
+        """
+        self.slots = slots
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.window = window
+        self.error_threshold = error_threshold
+        self.hold_windows = hold_windows
+        self.limiter = limiter
+        self.enabled = True
+        self.task = None
+        self.previous_throughput = None
+        self.increased = False
+        self.hold = 0
+        self.reset_window()
+
+    def reset_window(self):
+        self.window_bytes = 0
+        self.window_successes = 0
+        self.window_failures = 0
+        self.window_throttled = 0
+        self.window_started = time.monotonic()
+
+    def record_bytes(self, count):
+        """下载器每写入一块数据调用一次"""
+        self.window_bytes += count
+
+    def record_success(self):
+        self.window_successes += 1
+
+    def record_failure(self, status=None):
+        self.window_failures += 1
+        if status in THROTTLE_STATUSES:
+            self.window_throttled += 1
+            metrics.inc('download_throttled')
+
+    def set_bounds(self, min_limit=None, max_limit=None):
+        """调整上下限，当前并发数超出范围时立即收回"""
+        if min_limit is not None:
+            self.min_limit = min_limit
+        if max_limit is not None:
+            self.max_limit = max_limit
+        self.set_limit(max(self.min_limit, min(self.max_limit, self.slots.limit)))
+
+    def set_limit(self, limit):
+        if limit != self.slots.limit:
+            print(f"下载并发数: {self.slots.limit} -> {limit}")
+            self.slots.resize(limit)
+        metrics.set_gauge('download_concurrency_limit', limit)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.window)
+            if self.enabled:
+                self.adjust()
+            else:
+                self.reset_window()
+
+    def adjust(self):
+        """根据上一个窗口的统计调整并发数，返回新的并发数"""
+        elapsed = max(time.monotonic() - self.window_started, 1e-6)
+        throughput = self.window_bytes / elapsed
+        finished = self.window_successes + self.window_failures
+        limit = self.slots.limit
+        if not self.window_bytes and not finished:
+            # 空闲窗口不参与调整
+            self.reset_window()
+            return limit
+        new_limit = limit
+
+        if self.window_throttled:
+            new_limit = max(self.min_limit, limit // 2)
+            self.hold = self.hold_windows
+        elif finished and self.window_failures / finished > self.error_threshold:
+            new_limit = max(self.min_limit, limit - 1)
+            self.hold = self.hold_windows
+        elif self.increased and self.previous_throughput and throughput < self.previous_throughput * 1.05:
+            # 上次增加没有带来提升
+            new_limit = max(self.min_limit, limit - 1)
+            self.hold = self.hold_windows
+        elif self.hold:
+            self.hold -= 1
+        elif self.slots.in_use() >= limit and not self.near_bandwidth_limit(throughput):
+            new_limit = min(self.max_limit, limit + 1)
+
+        self.increased = new_limit > limit
+        self.previous_throughput = throughput
+        self.set_limit(new_limit)
+        self.reset_window()
+        return new_limit
+
+    def near_bandwidth_limit(self, throughput):
+        return bool(self.limiter and self.limiter.rate and throughput >= self.limiter.rate * 0.9)
@@ -0,0 +1,98 @@
+"""
+对比旧的整页 html.parser 解析与 page_parser（lxml + SoupStrainer）的解析耗时
+
+用法: python benchmarks/bench_parser.py [重复次数]
+"""
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from page_parser import HTML_PARSER, parse_post_cards, parse_video_links, video_filename
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def legacy_parse_post_cards(html):
+    """旧的列表页解析：构建完整的文档树后再查找"""
+    soup = BeautifulSoup(html, 'html.parser')
+    posts = []
+    for article in soup.find_all('article', class_=['post-card', 'post-card--preview']):
+        post_data = {
+            'post_id': article.get('data-id'),
+            'service': article.get('data-service'),
+            'user_id': article.get('data-user'),
+            'url': None,
+            'timestamp': None,
+            'favorites': None,
+            'attachments': None
+        }
+        link = article.find('a', class_='fancy-link')
+        if link:
+            post_data['url'] = link.get('href')
+        timestamp = article.find('time', class_='timestamp')
+        if timestamp:
+            post_data['timestamp'] = timestamp.get('datetime')
+        footer = article.find('footer')
+        if footer:
+            footer_div = footer.find('div')
+            if footer_div:
+                inner_div = footer_div.find('div')
+                if inner_div:
+                    for div in inner_div.find_all('div'):
+                        text = div.text.strip()
+                        if 'attachments' in text:
+                            post_data['attachments'] = text.split(' ')[0]
+                        elif 'favorites' in text:
+                            post_data['favorites'] = text.split(' ')[0]
+        posts.append(post_data)
+    return posts
+
+
+def legacy_parse_video_links(html):
+    """旧的帖子页解析"""
+    soup = BeautifulSoup(html, 'html.parser')
+    video_links = []
+    for link in soup.find_all('a', class_='post__attachment-link'):
+        href = link.get('href')
+        if href and any(ext in href.lower() for ext in ['.mp4', '.mov', '.avi', '.wmv', '.flv']):
+            # 文件名规则与解析方式无关，两边相同才能比较解析结果
+            video_links.append({'url': href, 'filename': video_filename(href, link.get('download'))})
+    return video_links
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def measure(func, html, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(html)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main(repeat):
+    listing = load_fixture('listing.html')
+    post = load_fixture('post.html')
+    cases = (
+        ('列表页', listing, legacy_parse_post_cards, lambda html: [c.to_dict() for c in parse_post_cards(html)]),
+        ('帖子页', post, legacy_parse_video_links, lambda html: [v.to_dict() for v in parse_video_links(html)]),
+    )
+
+    print(f"解析器: {HTML_PARSER}，重复 {repeat} 次")
+    for name, html, legacy, current in cases:
+        legacy_time, legacy_result = measure(legacy, html, repeat)
+        current_time, current_result = measure(current, html, repeat)
+        if legacy_result != current_result:
+            print(f"{name}: 解析结果不一致!")
+        print(f"{name}（{len(html) // 1024}KB）: 旧解析 {legacy_time * 1000:.2f}毫秒，"
+              f"新解析 {current_time * 1000:.2f}毫秒，加速 {legacy_time / current_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
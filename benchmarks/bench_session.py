@@ -0,0 +1,61 @@
+"""
+对比每个文件新建 ClientSession 与共享 SessionManager 的单文件开销
+
+用法: python benchmarks/bench_session.py [文件数] [文件大小KB]
+"""
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_session import SessionManager
+from benchmarks.local_server import make_app, start_server
+
+
+async def fetch_body(session, url):
+    async with session.get(url) as response:
+        async for _ in response.content.iter_chunked(32768):
+            pass
+
+
+async def per_file_session(base_url, count):
+    """旧的下载方式：每个文件创建一个新会话"""
+    for i in range(count):
+        async with aiohttp.ClientSession() as session:
+            await fetch_body(session, f"{base_url}/files/{i}.mp4")
+
+
+async def shared_session(base_url, count):
+    """共享 SessionManager 的连接池"""
+    sessions = SessionManager()
+    try:
+        for i in range(count):
+            session = await sessions.get_session()
+            await fetch_body(session, f"{base_url}/files/{i}.mp4")
+    finally:
+        await sessions.close()
+
+
+async def main(count, size_kb):
+    runner, base_url = await start_server(make_app(file_size=size_kb * 1024))
+    try:
+        results = {}
+        for name, func in (('每个文件新建会话', per_file_session), ('共享会话', shared_session)):
+            start = time.perf_counter()
+            await func(base_url, count)
+            results[name] = time.perf_counter() - start
+
+        for name, elapsed in results.items():
+            print(f"{name}: 总计 {elapsed:.3f}秒，单文件 {elapsed / count * 1000:.2f}毫秒")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    asyncio.run(main(count, size_kb))
@@ -0,0 +1,129 @@
+"""
+启动耗时基准：在新的解释器中用 python -X importtime 导入 bot.py
+
+输出导入 bot 的总耗时（多次运行取中位数）、耗时最多的直接依赖，以及 selenium、bs4
+这些只在用到时才需要的模块是否在启动时被导入。Discord 和 Dropbox 都不会连接，
+--output 保存结果，--baseline 与之前保存的结果对比。
+
+用法: python benchmarks/bench_startup.py [--repeat 5] [--top 10] [--output result.json] [--baseline base.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 启动时不应导入的模块
+LAZY_MODULES = ('selenium', 'bs4')
+
+IMPORT_SCRIPT = f"""
+import json, sys
+sys.path.insert(0, {ROOT!r})
+import bot
+print(json.dumps([name for name in {LAZY_MODULES!r} if name in sys.modules]))
+"""
+
+
+def parse_importtime(stderr):
+    """
+    解析 -X importtime 的输出
+    :return: [(模块名, 缩进层级, 累计耗时微秒)]
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(cumulative)))
+    return rows
+
+
+def run_once(work_dir):
+    env = dict(os.environ, DISCORD_TOKEN='benchmark', DISCORD_CHANNEL_ID='0')
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', IMPORT_SCRIPT],
+        cwd=work_dir, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"导入 bot 失败:\n{process.stderr[-2000:]}")
+    rows = parse_importtime(process.stderr)
+    bot_us = next(cumulative for name, depth, cumulative in rows if name == 'bot' and depth == 0)
+    # bot 的直接依赖在 importtime 输出中的缩进比 bot 多一级
+    children = {}
+    for name, depth, cumulative in rows:
+        if depth == 1:
+            children[name] = children.get(name, 0) + cumulative
+    return {
+        'wall_ms': wall * 1000,
+        'bot_import_ms': bot_us / 1000,
+        'children': children,
+        'lazy_loaded': json.loads(process.stdout.strip().splitlines()[-1])
+    }
+
+
+def run_benchmark(args):
+    # ScraperConfig 在当前目录读写 config.json，放到临时目录中
+    with tempfile.TemporaryDirectory(prefix='coomer-startup-') as work_dir:
+        runs = [run_once(work_dir) for _ in range(args.repeat)]
+    children = {}
+    for run in runs:
+        for name, cumulative in run['children'].items():
+            children.setdefault(name, []).append(cumulative / 1000)
+    slowest = sorted(
+        ((name, statistics.median(values)) for name, values in children.items()), key=lambda item: -item[1]
+    )
+    return {
+        'repeat': args.repeat,
+        'wall_ms': statistics.median(run['wall_ms'] for run in runs),
+        'bot_import_ms': statistics.median(run['bot_import_ms'] for run in runs),
+        'slowest_imports': slowest[:args.top],
+        'lazy_loaded': runs[-1]['lazy_loaded']
+    }
+
+
+def print_result(result, baseline=None):
+    print(f"运行 {result['repeat']} 次，取中位数")
+    for label, key in (('进程总耗时（毫秒）', 'wall_ms'), ('导入 bot（毫秒）', 'bot_import_ms')):
+        line = f"{label}: {result[key]:.1f}"
+        previous = baseline.get(key) if baseline else None
+        if previous:
+            change = (result[key] - previous) / previous * 100
+            line += f"（基线 {previous:.1f}，{change:+.1f}%）"
+        print(line)
+    print("耗时最多的直接依赖:")
+    for name, milliseconds in result['slowest_imports']:
+        print(f"  {name}: {milliseconds:.1f} 毫秒")
+    if result['lazy_loaded']:
+        print(f"启动时导入了应延迟导入的模块: {', '.join(result['lazy_loaded'])}")
+    else:
+        print(f"{', '.join(LAZY_MODULES)} 均未在启动时导入")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='启动耗时基准')
+    parser.add_argument('--repeat', type=int, default=5, help='运行次数')
+    parser.add_argument('--top', type=int, default=10, help='显示耗时最多的前几个依赖')
+    parser.add_argument('--output', help='把结果保存为 JSON')
+    parser.add_argument('--baseline', help='与之前保存的 JSON 结果对比')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    result = run_benchmark(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_result(result, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
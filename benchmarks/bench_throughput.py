@@ -0,0 +1,205 @@
+"""
+端到端吞吐量基准：回放本地的列表页和帖子页，下载合成视频并上传到本地的 Dropbox 替身服务器
+
+不访问真实站点、Chrome 和 Dropbox。输出帖子/秒、MB/秒、CPU 时间（及每 GB 下载的 CPU 时间）、峰值 RSS 和总耗时，
+--output 保存结果，--baseline 与之前保存的结果对比，便于比较不同提交之间的性能变化。
+
+用法: python benchmarks/bench_throughput.py [--mode batch|pipeline] [--file-size-kb 1024]
+      [--latency-ms 0] [--bandwidth-kbps 0] [--no-upload] [--output result.json] [--baseline base.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper import CoomerScraper
+from pipeline import ScrapePipeline
+from metrics import metrics
+from dropbox_client import DropboxClient
+from dropbox_sync import DropboxSync
+from http_session import SessionManager
+from benchmarks.stub_dropbox import STUB_APP_KEY, STUB_APP_SECRET, STUB_REFRESH_TOKEN, make_dropbox_app
+from benchmarks.local_server import make_replay_app, start_server_process
+
+MiB = 1024 * 1024
+
+# 对比时数值越大越好的指标
+HIGHER_IS_BETTER = ('posts_per_second', 'mb_per_second')
+GiB = 1024 * MiB
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），不支持的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / MiB if sys.platform == 'darwin' else peak / 1024
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def sample_loop_lag(interval=0.01):
+    """每隔 interval 秒测一次事件循环的调度延迟，阻塞事件循环的同步调用会让延迟变大"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        metrics.observe('event_loop_lag_seconds', time.perf_counter() - start - interval)
+
+
+async def fetch_stub_stats(dropbox_sync):
+    session = await dropbox_sync.client.session_manager.get_session()
+    async with session.get(f"{dropbox_sync.client.api_url}/stub/stats") as response:
+        return await response.json()
+
+
+async def run_scraper(args, base_url, dropbox_url, work_dir):
+    """
+    运行一次完整的抓取
+    :return: (帖子数, 视频数, 上传的字节数)
+    """
+    scraper = CoomerScraper(fetch_mode='http', post_concurrency=args.post_concurrency, data_dir=work_dir)
+    scraper.base_url = base_url
+    dropbox_sync = None
+    if dropbox_url:
+        client = DropboxClient(
+            SessionManager(), refresh_token=STUB_REFRESH_TOKEN, app_key=STUB_APP_KEY, app_secret=STUB_APP_SECRET,
+            api_url=dropbox_url, content_url=dropbox_url, token_url=f"{dropbox_url}/oauth2/token"
+        )
+        dropbox_sync = DropboxSync(hash_catalog=scraper.hash_catalog, client=client)
+
+    listing_url = f"{base_url}/posts/popular"
+    lag_task = asyncio.create_task(sample_loop_lag())
+    try:
+        if args.mode == 'pipeline':
+            stats = await ScrapePipeline(scraper, dropbox_sync).run([listing_url])
+            posts, videos = stats['posts'], stats['videos']
+        else:
+            results = await scraper.run_async(listing_url)
+            await scraper.download_all_videos(results, dropbox_sync=dropbox_sync)
+            posts, videos = len(results), sum(len(post['videos']) for post in results)
+        uploaded = (await fetch_stub_stats(dropbox_sync))['uploaded_bytes'] if dropbox_sync else 0
+        return posts, videos, uploaded
+    finally:
+        lag_task.cancel()
+        if dropbox_sync:
+            await dropbox_sync.close()
+        await scraper.close()
+        scraper.history.close()
+        scraper.hash_catalog.close()
+
+
+def run_benchmark(args):
+    process, base_url = start_server_process(
+        make_replay_app,
+        file_size=args.file_size_kb * 1024,
+        latency=args.latency_ms / 1000,
+        bandwidth=args.bandwidth_kbps * 1024 or None
+    )
+    dropbox_process, dropbox_url = None, None
+    if not args.no_upload:
+        dropbox_process, dropbox_url = start_server_process(make_dropbox_app, latency=args.dropbox_latency_ms / 1000)
+    try:
+        with tempfile.TemporaryDirectory(prefix='coomer-bench-') as work_dir:
+            metrics.start_run()
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+            posts, videos, uploaded = asyncio.run(run_scraper(args, base_url, dropbox_url, work_dir))
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+    finally:
+        for server in (process, dropbox_process):
+            if server:
+                server.terminate()
+                server.join()
+
+    downloaded = metrics.counters.get('download_bytes', 0)
+    return {
+        'commit': current_commit(),
+        'mode': args.mode,
+        'file_size_kb': args.file_size_kb,
+        'latency_ms': args.latency_ms,
+        'bandwidth_kbps': args.bandwidth_kbps,
+        'posts': posts,
+        'videos': videos,
+        'downloaded_mb': downloaded / MiB,
+        'uploaded_mb': uploaded / MiB,
+        'wall_seconds': wall,
+        'cpu_seconds': cpu,
+        'cpu_seconds_per_gb': cpu / (downloaded / GiB) if downloaded else None,
+        'posts_per_second': posts / wall if wall else 0,
+        'mb_per_second': downloaded / MiB / wall if wall else 0,
+        'peak_rss_mb': peak_rss_mb(),
+        'loop_lag_p99_ms': (metrics.percentile('event_loop_lag_seconds', 0.99) or 0) * 1000,
+        'download_failures': metrics.counters.get('downloads_failed', 0),
+        'upload_failures': metrics.counters.get('uploads_failed', 0)
+    }
+
+
+def print_result(result, baseline=None):
+    print(f"\n提交: {result['commit']}，模式: {result['mode']}")
+    print(f"帖子: {result['posts']}，视频: {result['videos']}，"
+          f"下载: {result['downloaded_mb']:.1f}MB，上传: {result['uploaded_mb']:.1f}MB，"
+          f"失败: 下载 {result['download_failures']} / 上传 {result['upload_failures']}")
+    rows = (
+        ('帖子/秒', 'posts_per_second', '{:.2f}'),
+        ('MB/秒', 'mb_per_second', '{:.2f}'),
+        ('总耗时（秒）', 'wall_seconds', '{:.2f}'),
+        ('CPU 时间（秒）', 'cpu_seconds', '{:.2f}'),
+        ('CPU 秒/GB', 'cpu_seconds_per_gb', '{:.2f}'),
+        ('峰值 RSS（MB）', 'peak_rss_mb', '{:.1f}'),
+        ('事件循环延迟 p99（毫秒）', 'loop_lag_p99_ms', '{:.1f}'),
+    )
+    for label, key, fmt in rows:
+        value = result[key]
+        line = f"{label}: {fmt.format(value) if value is not None else '-'}"
+        previous = baseline.get(key) if baseline else None
+        if value is not None and previous:
+            change = (value - previous) / previous * 100
+            better = change > 0 if key in HIGHER_IS_BETTER else change < 0
+            line += f"（基线 {fmt.format(previous)}，{change:+.1f}%{'' if abs(change) < 1 else ' ↑' if better else ' ↓'}）"
+        print(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='端到端吞吐量基准')
+    parser.add_argument('--mode', choices=('batch', 'pipeline'), default='batch',
+                        help='batch: run_async + download_all_videos；pipeline: ScrapePipeline')
+    parser.add_argument('--file-size-kb', type=int, default=1024, help='每个视频文件的大小')
+    parser.add_argument('--latency-ms', type=float, default=0, help='服务器每个请求的延迟')
+    parser.add_argument('--bandwidth-kbps', type=int, default=0, help='每个连接的下载带宽（KB/秒），0 为不限速')
+    parser.add_argument('--dropbox-latency-ms', type=float, default=0, help='Dropbox 替身服务器每次调用的延迟')
+    parser.add_argument('--post-concurrency', type=int, default=4)
+    parser.add_argument('--no-upload', action='store_true', help='不上传到 Dropbox 替身服务器')
+    parser.add_argument('--output', help='把结果保存为 JSON')
+    parser.add_argument('--baseline', help='与之前保存的 JSON 结果对比')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    result = run_benchmark(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_result(result, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
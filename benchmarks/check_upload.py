@@ -0,0 +1,136 @@
+"""
+Dropbox 上传路径检查：用记录调用的假客户端代替 DropboxClient，不发起网络请求
+
+检查分块上传时每块不超过 chunk_size、各块合计等于文件大小，并发上传的文件数不超过
+max_concurrent_uploads，同时在发送中的数据不超过 chunk_size × 并发数（即内存占用与文件大小无关）。
+任何一项不满足时以非零状态退出。
+
+用法: python benchmarks/check_upload.py [--chunk-kb 64] [--concurrency 2] [--files 6]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dropbox_client import DropboxApiError
+from dropbox_sync import DropboxSync
+
+
+class RecordingDropboxClient:
+    """记录每次上传的端点、块大小和同时进行中的调用，接口与 DropboxClient 的 rpc / upload 相同"""
+
+    def __init__(self, delay=0.005):
+        self.delay = delay
+        self.chunks = []
+        self.rpc_calls = []
+        self.in_flight = 0
+        self.in_flight_bytes = 0
+        self.max_in_flight = 0
+        self.max_in_flight_bytes = 0
+        self.sessions = 0
+
+    async def rpc(self, endpoint, args=None):
+        self.rpc_calls.append(endpoint)
+        if endpoint == 'files/get_metadata':
+            raise DropboxApiError(endpoint, 'path/not_found/')
+        if endpoint == 'files/list_folder':
+            return {'entries': [], 'cursor': '', 'has_more': False}
+        if endpoint == 'files/upload_session/finish_batch_v2':
+            return {'entries': [{'.tag': 'success'} for _ in args['entries']]}
+        return {}
+
+    async def upload(self, endpoint, args, data):
+        self.chunks.append((endpoint, len(data)))
+        self.in_flight += 1
+        self.in_flight_bytes += len(data)
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.max_in_flight_bytes = max(self.max_in_flight_bytes, self.in_flight_bytes)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+            self.in_flight_bytes -= len(data)
+        if endpoint == 'files/upload_session/start':
+            self.sessions += 1
+            return {'session_id': f"session-{self.sessions}"}
+        return {}
+
+    async def close(self):
+        pass
+
+
+def write_file(directory, name, size):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    return path
+
+
+async def run_checks(args):
+    chunk_size = args.chunk_kb * 1024
+    failures = []
+
+    def check(ok, message):
+        print(f"{'✅' if ok else '❌'} {message}")
+        if not ok:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory(prefix='coomer-upload-') as work_dir:
+        # 单个文件：小文件一次上传，大文件走上传会话
+        client = RecordingDropboxClient()
+        sync = DropboxSync(client=client, chunk_size=chunk_size, max_concurrent_uploads=args.concurrency)
+        small = write_file(work_dir, 'small.mp4', chunk_size // 2)
+        large_size = chunk_size * 5 + 123
+        large = write_file(work_dir, 'large.mp4', large_size)
+        await sync.upload_file(small)
+        check([endpoint for endpoint, _ in client.chunks] == ['files/upload'], "小于一块的文件用一次 files/upload 上传")
+        client.chunks.clear()
+        await sync.upload_file(large)
+        endpoints = [endpoint for endpoint, _ in client.chunks]
+        check(
+            endpoints[0] == 'files/upload_session/start' and endpoints[-1] == 'files/upload_session/finish'
+            and set(endpoints[1:-1]) <= {'files/upload_session/append_v2'},
+            f"大文件按 start / append_v2 / finish 分 {len(endpoints)} 块上传"
+        )
+        check(max(size for _, size in client.chunks) <= chunk_size, f"每块不超过 {args.chunk_kb}KB")
+        check(sum(size for _, size in client.chunks) == large_size, "各块合计等于文件大小")
+        await sync.close()
+
+        # 并发上传：同时进行的文件数和发送中的数据量有上限
+        client = RecordingDropboxClient()
+        sync = DropboxSync(client=client, chunk_size=chunk_size, max_concurrent_uploads=args.concurrency)
+        paths = [write_file(work_dir, f"video_{i}.mp4", chunk_size * 3 + i) for i in range(args.files)]
+        results = await asyncio.gather(*(sync.upload_file(path) for path in paths))
+        check(all(results), f"{args.files} 个文件全部上传成功")
+        check(client.max_in_flight <= args.concurrency,
+              f"upload_file 同时上传 {client.max_in_flight} 个文件（上限 {args.concurrency}）")
+        check(client.max_in_flight_bytes <= chunk_size * args.concurrency,
+              f"发送中的数据最多 {client.max_in_flight_bytes // 1024}KB（上限 {chunk_size * args.concurrency // 1024}KB）")
+        await sync.close()
+
+        # sync_directory：并发上传会话后批量提交
+        client = RecordingDropboxClient()
+        sync = DropboxSync(client=client, chunk_size=chunk_size, max_concurrent_uploads=args.concurrency)
+        success, failed = await sync.sync_directory(work_dir)
+        check(failed == 0 and success == args.files + 2, f"sync_directory 上传 {success} 个文件，失败 {failed} 个")
+        check(client.rpc_calls.count('files/upload_session/finish_batch_v2') == 1, "上传会话通过一次 finish_batch_v2 提交")
+        check(client.max_in_flight <= args.concurrency,
+              f"sync_directory 同时上传 {client.max_in_flight} 个文件（上限 {args.concurrency}）")
+        await sync.close()
+    return failures
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Dropbox 上传路径检查')
+    parser.add_argument('--chunk-kb', type=int, default=64, help='分块大小')
+    parser.add_argument('--concurrency', type=int, default=2, help='max_concurrent_uploads')
+    parser.add_argument('--files', type=int, default=6, help='并发上传的文件数')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    failures = asyncio.run(run_checks(parse_args()))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,140 @@
+"""本地 HTTP 替身服务器，供基准测试使用"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+from aiohttp import web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# 帖子页中附件所在的 CDN 地址，回放时替换为本地地址
+ATTACHMENT_HOST_PATTERN = re.compile(r'https://n\d+\.coomer\.su/data/')
+
+
+def make_app(file_size=64 * 1024, ranges=True):
+    """
+    创建应用，/files/<name> 返回固定大小的随机内容
+    :param file_size: 每个文件的字节数
+    :param ranges: 是否支持 Range 请求
+    """
+    payload = os.urandom(file_size)
+
+    async def serve_file(request):
+        if not ranges:
+            return web.Response(body=payload, content_type='application/octet-stream')
+        return _ranged_response(request, payload)
+
+    app = web.Application()
+    app['payload'] = payload
+    app.router.add_get('/files/{name}', serve_file)
+    return app
+
+
+def make_replay_app(fixtures_dir=FIXTURES_DIR, file_size=1024 * 1024, latency=0.0, bandwidth=None):
+    """
+    回放录制的列表页和帖子页，并提供合成的视频文件
+
+    /posts/popular 返回 listing.html；每个帖子页返回 post.html，其中的附件地址改写为
+    本地的 /data/<post_id>/...，文件名加上帖子 ID 前缀，保证各帖子的视频互不重复。
+    :param fixtures_dir: 存放 listing.html 和 post.html 的目录
+    :param file_size: 每个视频文件的字节数
+    :param latency: 每个请求返回前的延迟（秒）
+    :param bandwidth: 每个连接的下载带宽（字节/秒），为 None 时不限速
+    """
+    with open(os.path.join(fixtures_dir, 'listing.html'), 'r', encoding='utf-8') as f:
+        listing = f.read()
+    with open(os.path.join(fixtures_dir, 'post.html'), 'r', encoding='utf-8') as f:
+        post = f.read()
+    payload = os.urandom(file_size)
+
+    async def serve_listing(request):
+        await asyncio.sleep(latency)
+        # 录制的列表只有一页，之后的分页为空
+        if request.query.get('o', '0') != '0':
+            return web.Response(text='<html><body></body></html>', content_type='text/html')
+        return web.Response(text=listing, content_type='text/html')
+
+    async def serve_post(request):
+        await asyncio.sleep(latency)
+        post_id = request.match_info['post_id']
+        html = ATTACHMENT_HOST_PATTERN.sub(f"http://{request.host}/data/{post_id}/", post)
+        html = html.replace('download="', f'download="{post_id}_')
+        return web.Response(text=html, content_type='text/html')
+
+    async def serve_file(request):
+        await asyncio.sleep(latency)
+        # 每个文件开头写入文件路径的摘要，内容去重不会把它们当作同一个文件
+        digest = hashlib.sha256(request.path.encode('utf-8')).digest()
+        return await _send(request, _ranged_response(request, digest + payload[len(digest):]), bandwidth)
+
+    app = web.Application()
+    app['payload'] = payload
+    app.router.add_get('/posts/popular', serve_listing)
+    app.router.add_get('/{service}/user/{user_id}/post/{post_id}', serve_post)
+    app.router.add_get('/data/{path:.+}', serve_file)
+    return app
+
+
+def _ranged_response(request, payload):
+    headers = {'Accept-Ranges': 'bytes'}
+    try:
+        byte_range = request.http_range
+    except ValueError:
+        return web.Response(status=416)
+    if byte_range.start is None and byte_range.stop is None:
+        return web.Response(body=payload, headers=headers, content_type='application/octet-stream')
+
+    body = payload[byte_range]
+    start = byte_range.start if byte_range.start is not None and byte_range.start >= 0 else len(payload) - len(body)
+    headers['Content-Range'] = f"bytes {start}-{start + len(body) - 1}/{len(payload)}"
+    return web.Response(status=206, body=body, headers=headers, content_type='application/octet-stream')
+
+
+async def _send(request, response, bandwidth, chunk_size=64 * 1024):
+    """按 bandwidth 限速分块发送 response 的内容"""
+    if not bandwidth or request.method == 'HEAD' or not response.body:
+        return response
+    body = response.body
+    stream = web.StreamResponse(status=response.status, headers=response.headers)
+    stream.content_length = len(body)
+    await stream.prepare(request)
+    for offset in range(0, len(body), chunk_size):
+        chunk = body[offset:offset + chunk_size]
+        await stream.write(chunk)
+        await asyncio.sleep(len(chunk) / bandwidth)
+    await stream.write_eof()
+    return stream
+
+
+async def start_server(app, host='127.0.0.1', port=0):
+    """启动服务器，返回 (runner, base_url)，port 为 0 时自动分配端口"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}"
+
+
+def start_server_process(factory, host='127.0.0.1', **kwargs):
+    """
+    在子进程中运行 factory(**kwargs) 创建的应用，服务端的 CPU 和内存不计入被测进程
+    :return: (进程, base_url)，结束时调用 process.terminate()
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_serve_forever, args=(factory, kwargs, host, queue), daemon=True)
+    process.start()
+    return process, queue.get(timeout=30)
+
+
+def _serve_forever(factory, kwargs, host, queue):
+    async def serve():
+        runner, base_url = await start_server(factory(**kwargs), host)
+        queue.put(base_url)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+    asyncio.run(serve())
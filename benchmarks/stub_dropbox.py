@@ -0,0 +1,240 @@
+"""
+Dropbox HTTP API 的本地替身服务器，供基准测试和验证 DropboxClient 使用
+
+实现 DropboxSync 用到的端点和 /oauth2/token。文件内容不保留，只记录大小和 content_hash。
+刷新得到的访问令牌在 token_lifetime 秒后过期，之后使用返回 401 expired_access_token。
+每次调用可模拟往返延迟和上传带宽，GET /stub/stats 返回调用次数、上传字节数和刷新次数。
+"""
+import asyncio
+import hashlib
+import json
+import time
+from aiohttp import web
+
+from dropbox_sync import CONTENT_HASH_BLOCK_SIZE
+
+# 替身服务器接受的 refresh token 和 app 凭据
+STUB_REFRESH_TOKEN = 'stub-refresh-token'
+STUB_APP_KEY = 'stub-app-key'
+STUB_APP_SECRET = 'stub-app-secret'
+
+
+class _Upload:
+    """按 4 MiB 块增量计算 Dropbox content_hash"""
+
+    def __init__(self):
+        self.size = 0
+        self.block = hashlib.sha256()
+        self.block_size = 0
+        self.block_hashes = b''
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            take = min(len(view), CONTENT_HASH_BLOCK_SIZE - self.block_size)
+            self.block.update(view[:take])
+            self.block_size += take
+            self.size += take
+            view = view[take:]
+            if self.block_size == CONTENT_HASH_BLOCK_SIZE:
+                self.block_hashes += self.block.digest()
+                self.block = hashlib.sha256()
+                self.block_size = 0
+
+    def content_hash(self):
+        block_hashes = self.block_hashes
+        if self.block_size:
+            block_hashes += self.block.digest()
+        return hashlib.sha256(block_hashes).hexdigest()
+
+
+def api_error(summary, status=409):
+    """Dropbox 格式的错误响应，如 api_error('path/not_found/')"""
+    tags = summary.strip('/').split('/')
+    error = {'.tag': tags[-1]}
+    for tag in reversed(tags[:-1]):
+        error = {'.tag': tag, tag: error}
+    return web.json_response({'error_summary': summary, 'error': error}, status=status)
+
+
+def make_dropbox_app(latency=0.0, bandwidth=None, list_page_size=2000, token_lifetime=14400,
+                     access_token=None, throttle_every=0):
+    """
+    :param latency: 每次调用的往返延迟（秒）
+    :param bandwidth: 上传带宽（字节/秒），为 None 时不限速
+    :param list_page_size: files/list_folder 每页的条目数
+    :param token_lifetime: 刷新得到的访问令牌的有效期（秒）
+    :param access_token: 额外接受的长期有效令牌
+    :param throttle_every: 每隔多少次上传请求返回一次 429（Retry-After: 0），0 为不返回
+    """
+    files = {}
+    sessions = {}
+    tokens = {access_token: None} if access_token else {}
+    stats = {'calls': {}, 'uploaded_bytes': 0, 'refreshes': 0, 'throttled': 0, 'rejected_tokens': 0}
+    counters = {'session': 0, 'token': 0, 'upload': 0}
+
+    def metadata(path, upload):
+        return {
+            '.tag': 'file',
+            'name': path.rsplit('/', 1)[-1],
+            'id': f"id:{len(files)}",
+            'path_display': path,
+            'path_lower': path.lower(),
+            'size': upload.size,
+            'content_hash': upload.content_hash()
+        }
+
+    def commit(path, upload):
+        files[path.lower()] = metadata(path, upload)
+        return files[path.lower()]
+
+    def endpoint(name, content=False):
+        """包装端点：检查令牌、记录调用并模拟延迟，content 端点的参数来自 Dropbox-API-Arg"""
+        def decorator(handler):
+            async def wrapper(request):
+                stats['calls'][name] = stats['calls'].get(name, 0) + 1
+                await asyncio.sleep(latency)
+                token = request.headers.get('Authorization', '')[len('Bearer '):]
+                if token not in tokens:
+                    stats['rejected_tokens'] += 1
+                    return api_error('invalid_access_token/', status=401)
+                if tokens[token] is not None and time.monotonic() >= tokens[token]:
+                    stats['rejected_tokens'] += 1
+                    return api_error('expired_access_token/', status=401)
+                if content:
+                    counters['upload'] += 1
+                    if throttle_every and counters['upload'] % throttle_every == 0:
+                        stats['throttled'] += 1
+                        return web.json_response(
+                            {'error_summary': 'too_many_requests/', 'error': {'.tag': 'too_many_requests'}},
+                            status=429, headers={'Retry-After': '0'}
+                        )
+                    args = json.loads(request.headers['Dropbox-API-Arg'])
+                    data = await request.read()
+                    stats['uploaded_bytes'] += len(data)
+                    if bandwidth:
+                        await asyncio.sleep(len(data) / bandwidth)
+                    return await handler(args, data)
+                body = await request.read()
+                return await handler(json.loads(body) if body else None)
+            return wrapper
+        return decorator
+
+    async def refresh_token(request):
+        form = await request.post()
+        if (form.get('grant_type') != 'refresh_token' or form.get('refresh_token') != STUB_REFRESH_TOKEN
+                or form.get('client_id') != STUB_APP_KEY or form.get('client_secret') != STUB_APP_SECRET):
+            return web.json_response({'error': 'invalid_grant'}, status=400)
+        await asyncio.sleep(latency)
+        stats['refreshes'] += 1
+        counters['token'] += 1
+        token = f"stub-access-{counters['token']}"
+        tokens[token] = time.monotonic() + token_lifetime
+        return web.json_response({'access_token': token, 'token_type': 'bearer', 'expires_in': token_lifetime})
+
+    @endpoint('users/get_current_account')
+    async def get_current_account(args):
+        return web.json_response({'account_id': 'dbid:stub', 'email': 'stub@example.com'})
+
+    @endpoint('users/get_space_usage')
+    async def get_space_usage(args):
+        used = sum(entry['size'] for entry in files.values())
+        return web.json_response({'used': used, 'allocation': {'.tag': 'individual', 'allocated': 2 * 1024 ** 4}})
+
+    @endpoint('files/get_metadata')
+    async def get_metadata(args):
+        entry = files.get(args['path'].lower())
+        if entry is None:
+            return api_error('path/not_found/')
+        return web.json_response(entry)
+
+    @endpoint('files/upload', content=True)
+    async def upload(args, data):
+        upload = _Upload()
+        upload.write(data)
+        return web.json_response(commit(args['path'], upload))
+
+    @endpoint('files/upload_session/start', content=True)
+    async def session_start(args, data):
+        counters['session'] += 1
+        session_id = f"session-{counters['session']}"
+        sessions[session_id] = _Upload()
+        sessions[session_id].write(data)
+        return web.json_response({'session_id': session_id})
+
+    @endpoint('files/upload_session/append_v2', content=True)
+    async def session_append(args, data):
+        cursor = args['cursor']
+        upload = sessions.get(cursor['session_id'])
+        if upload is None:
+            return api_error('lookup_failed/not_found/')
+        if upload.size != cursor['offset']:
+            return api_error('lookup_failed/incorrect_offset/')
+        upload.write(data)
+        return web.json_response(None)
+
+    @endpoint('files/upload_session/finish', content=True)
+    async def session_finish(args, data):
+        cursor = args['cursor']
+        upload = sessions.get(cursor['session_id'])
+        if upload is None or upload.size != cursor['offset']:
+            return api_error('lookup_failed/incorrect_offset/')
+        upload.write(data)
+        del sessions[cursor['session_id']]
+        return web.json_response(commit(args['commit']['path'], upload))
+
+    @endpoint('files/upload_session/finish_batch_v2')
+    async def finish_batch(args):
+        entries = []
+        for entry in args['entries']:
+            upload = sessions.pop(entry['cursor']['session_id'], None)
+            if upload is None:
+                entries.append({'.tag': 'failure', 'failure': {'.tag': 'lookup_failed'}})
+            else:
+                entries.append(dict(commit(entry['commit']['path'], upload), **{'.tag': 'success'}))
+        return web.json_response({'entries': entries})
+
+    def list_page(prefix, start):
+        entries = [entry for path, entry in sorted(files.items()) if path.startswith(prefix)]
+        end = start + list_page_size
+        return web.json_response({
+            'entries': entries[start:end], 'cursor': f"{prefix}|{end}", 'has_more': end < len(entries)
+        })
+
+    @endpoint('files/list_folder')
+    async def list_folder(args):
+        prefix = args['path'].lower().rstrip('/') + '/'
+        if not any(path.startswith(prefix) for path in files):
+            return api_error('path/not_found/')
+        return list_page(prefix, 0)
+
+    @endpoint('files/list_folder/continue')
+    async def list_folder_continue(args):
+        prefix, start = args['cursor'].rsplit('|', 1)
+        return list_page(prefix, int(start))
+
+    @endpoint('sharing/create_shared_link_with_settings')
+    async def create_shared_link(args):
+        return web.json_response({'url': f"https://stub.dropbox/s{args['path']}", 'name': args['path'].rsplit('/', 1)[-1]})
+
+    async def get_stats(request):
+        return web.json_response(dict(stats, files=len(files)))
+
+    app = web.Application(client_max_size=256 * 1024 * 1024)
+    app.router.add_post('/oauth2/token', refresh_token)
+    for name, handler in (
+        ('users/get_current_account', get_current_account),
+        ('users/get_space_usage', get_space_usage),
+        ('files/get_metadata', get_metadata),
+        ('files/list_folder', list_folder),
+        ('files/list_folder/continue', list_folder_continue),
+        ('files/upload_session/finish_batch_v2', finish_batch),
+        ('sharing/create_shared_link_with_settings', create_shared_link),
+        ('files/upload', upload),
+        ('files/upload_session/start', session_start),
+        ('files/upload_session/append_v2', session_append),
+        ('files/upload_session/finish', session_finish),
+    ):
+        app.router.add_post(f"/2/{name}", handler)
+    app.router.add_get('/stub/stats', get_stats)
+    return app
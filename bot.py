@@ -7,6 +7,12 @@ from datetime import datetime
 from dotenv import load_dotenv
 from scraper import CoomerScraper
 from dropbox_sync import DropboxSync
+from pipeline import ScrapePipeline
+from scheduler import SourceScheduler, PrioritySemaphore
+from bandwidth import TokenBucket, AdaptiveConcurrency
+from staging import GiB
+from dedup import HashCatalog
+from metrics import metrics, start_exporter
 import time
 import aiohttp
 
@@ -25,15 +31,9 @@ intents.message_content = True
 bot = commands.Bot(command_prefix='!', intents=intents)
 
 # 存储进度消息的ID
-progress_message = None
 scraper_instance = None
-current_task = None
-dropbox_sync = None if not DROPBOX_TOKEN else DropboxSync(
-    access_token=DROPBOX_TOKEN,
-    refresh_token=DROPBOX_REFRESH_TOKEN,
-    app_key=DROPBOX_APP_KEY,
-    app_secret=DROPBOX_APP_SECRET
-)
+metrics_runner = None
+dropbox_connect_task = None
 
 class ScraperConfig:
     def __init__(self):
@@ -42,6 +42,25 @@ class ScraperConfig:
             'popular': 'https://coomer.su/posts/popular'
         }
         self.auto_sync = True  # 是否自动同步到 Dropbox
+        self.fetch_mode = 'http'  # 页面抓取方式: http 优先，失败时回退到浏览器；browser 始终使用浏览器
+        self.per_host_limit = 4  # 每个主机的最大并发页面请求数
+        self.post_concurrency = 4  # 同时解析的帖子详情页数量
+        self.download_concurrency = 3  # 同时下载的视频数量
+        self.upload_concurrency = 2  # 同时上传到 Dropbox 的文件数量
+        self.metrics_port = 9108  # 本地指标导出端口，0 表示不启动
+        self.browser_pool_size = 2  # 浏览器抓取时的最大 WebDriver 实例数
+        self.browser_max_pages = 50  # 每个 WebDriver 加载多少个页面后重启
+        self.browser_max_memory_mb = 1024  # WebDriver 内存超过该值（MB）时重启
+        self.max_listing_pages = 10  # 每个 URL 最多向后翻的列表页数
+        self.max_total_downloads = 6  # 所有来源合计的最大同时下载数（自适应时为上限）
+        self.adaptive_downloads = True  # 是否根据吞吐量、失败率和 429/503 自动调整同时下载数
+        self.max_bandwidth_mb = 0  # 下载和上传共用的带宽上限（MB/秒），0 表示不限速
+        self.retry_attempts = 4  # 页面请求和下载的最大尝试次数
+        self.retry_max_delay = 60  # 两次尝试之间的最长等待时间（秒）
+        self.preallocate_downloads = True  # 下载前预先分配磁盘空间（posix_fallocate）
+        self.staging_quota_gb = 10  # 下载目录最多占用的空间（GB），0 表示不限制
+        self.min_free_disk_gb = 2  # 磁盘剩余空间低于该值（GB）时暂停下载
+        self.sources = {}  # 来源的单独设置: {名称: {interval_minutes, priority, download_concurrency}}
         self.load_config()
     
     def load_config(self):
@@ -51,6 +70,25 @@ class ScraperConfig:
                 self.interval_minutes = data.get('interval_minutes', 60)
                 self.urls = data.get('urls', self.urls)
                 self.auto_sync = data.get('auto_sync', True)
+                self.fetch_mode = data.get('fetch_mode', 'http')
+                self.per_host_limit = data.get('per_host_limit', 4)
+                self.post_concurrency = data.get('post_concurrency', 4)
+                self.download_concurrency = data.get('download_concurrency', 3)
+                self.upload_concurrency = data.get('upload_concurrency', 2)
+                self.metrics_port = data.get('metrics_port', 9108)
+                self.browser_pool_size = data.get('browser_pool_size', 2)
+                self.browser_max_pages = data.get('browser_max_pages', 50)
+                self.browser_max_memory_mb = data.get('browser_max_memory_mb', 1024)
+                self.max_listing_pages = data.get('max_listing_pages', 10)
+                self.max_total_downloads = data.get('max_total_downloads', 6)
+                self.adaptive_downloads = data.get('adaptive_downloads', True)
+                self.max_bandwidth_mb = data.get('max_bandwidth_mb', 0)
+                self.retry_attempts = data.get('retry_attempts', 4)
+                self.retry_max_delay = data.get('retry_max_delay', 60)
+                self.preallocate_downloads = data.get('preallocate_downloads', True)
+                self.staging_quota_gb = data.get('staging_quota_gb', 10)
+                self.min_free_disk_gb = data.get('min_free_disk_gb', 2)
+                self.sources = data.get('sources', {})
         except FileNotFoundError:
             self.save_config()
     
@@ -59,11 +97,71 @@ class ScraperConfig:
             json.dump({
                 'interval_minutes': self.interval_minutes,
                 'urls': self.urls,
-                'auto_sync': self.auto_sync
+                'auto_sync': self.auto_sync,
+                'fetch_mode': self.fetch_mode,
+                'per_host_limit': self.per_host_limit,
+                'post_concurrency': self.post_concurrency,
+                'download_concurrency': self.download_concurrency,
+                'upload_concurrency': self.upload_concurrency,
+                'metrics_port': self.metrics_port,
+                'browser_pool_size': self.browser_pool_size,
+                'browser_max_pages': self.browser_max_pages,
+                'browser_max_memory_mb': self.browser_max_memory_mb,
+                'max_listing_pages': self.max_listing_pages,
+                'max_total_downloads': self.max_total_downloads,
+                'adaptive_downloads': self.adaptive_downloads,
+                'max_bandwidth_mb': self.max_bandwidth_mb,
+                'retry_attempts': self.retry_attempts,
+                'retry_max_delay': self.retry_max_delay,
+                'preallocate_downloads': self.preallocate_downloads,
+                'staging_quota_gb': self.staging_quota_gb,
+                'min_free_disk_gb': self.min_free_disk_gb,
+                'sources': self.sources
             }, f, indent=2)
 
+    def get_sources(self):
+        """每个来源的调度设置，未单独设置的项使用全局值"""
+        sources = {}
+        for name, url in self.urls.items():
+            settings = self.sources.get(name, {})
+            sources[name] = {
+                'url': url,
+                'interval_minutes': settings.get('interval_minutes', self.interval_minutes),
+                'priority': settings.get('priority', 0),
+                'download_concurrency': settings.get('download_concurrency', self.download_concurrency)
+            }
+        return sources
+
 config = ScraperConfig()
 
+# 下载和 Dropbox 上传共用的带宽限速
+bandwidth_limiter = TokenBucket(config.max_bandwidth_mb * 1024**2)
+# 所有来源共享的下载名额，自适应时从 download_concurrency 开始调整
+download_slots = PrioritySemaphore(
+    min(config.download_concurrency, config.max_total_downloads) if config.adaptive_downloads else config.max_total_downloads
+)
+download_controller = AdaptiveConcurrency(download_slots, max_limit=config.max_total_downloads, limiter=bandwidth_limiter)
+download_controller.enabled = config.adaptive_downloads
+
+# 下载和 Dropbox 同步共用的内容哈希目录，第一次用到时才打开，导入 bot.py 时不创建数据库
+hash_catalog = None
+
+def get_hash_catalog():
+    global hash_catalog
+    if hash_catalog is None:
+        hash_catalog = HashCatalog(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'content_hashes.db'))
+    return hash_catalog
+
+# 哈希目录在 on_ready 中设置
+dropbox_sync = None if not DROPBOX_TOKEN else DropboxSync(
+    access_token=DROPBOX_TOKEN,
+    refresh_token=DROPBOX_REFRESH_TOKEN,
+    app_key=DROPBOX_APP_KEY,
+    app_secret=DROPBOX_APP_SECRET,
+    max_concurrent_uploads=config.upload_concurrency,
+    limiter=bandwidth_limiter
+)
+
 async def update_progress(message, content):
     """更新进度消息"""
     if message:
@@ -77,19 +175,28 @@ async def update_progress(message, content):
         return await channel.send(content)
 
 class DiscordScraperCallback:
-    def __init__(self, message):
+    """
+    爬虫进度回调
+
+    回调只更新内存中的状态，由后台渲染任务按固定间隔把最新状态编辑到 Discord 消息，
+    同一时间最多只有一个编辑请求，Discord 响应慢不会拖慢下载。
+    """
+    def __init__(self, message, update_interval=8, title="🔄 爬取进度"):
         self.message = message
+        self.title = title
         self.start_time = datetime.now()
         self.total_posts = 0
         self.processed_posts = 0
         self.total_videos = 0
         self.downloaded_videos = 0
         self.synced_videos = 0
-        self.current_file = ""
-        self.download_progress = 0
+        self.active_downloads = {}  # 文件名 -> 下载进度百分比
         self.sync_status = ""
-        self.last_update_time = datetime.now()  # 添加最后更新时间记录
-        self.update_interval = 8  # 设置更新间隔为8秒
+        self.update_interval = update_interval  # 消息编辑间隔（秒）
+        self.max_listed_downloads = 5  # 最多单独列出的下载数
+        self.version = 0  # 每次状态变化加一
+        self.rendered_version = 0
+        self.render_task = None
 
     def format_time(self, seconds):
         if seconds < 60:
@@ -102,13 +209,53 @@ class DiscordScraperCallback:
         bar = "█" * filled + "░" * (length - filled)
         return f"[{bar}] {percentage:.1f}%"
 
-    async def update_progress(self):
+    def start(self):
+        """启动后台渲染任务"""
+        if self.render_task is None:
+            self.render_task = asyncio.create_task(self.render_loop())
+
+    async def stop(self):
+        """停止后台渲染任务，并渲染最终状态"""
+        if self.render_task:
+            self.render_task.cancel()
+            try:
+                await self.render_task
+            except asyncio.CancelledError:
+                pass
+            self.render_task = None
+        try:
+            await self.render()
+        except Exception as e:
+            print(f"更新进度消息失败: {e}")
+
+    async def render_loop(self):
+        while True:
+            await asyncio.sleep(self.update_interval)
+            try:
+                await self.render()
+            except Exception as e:
+                print(f"更新进度消息失败: {e}")
+
+    async def render(self):
+        """状态有变化时编辑进度消息"""
+        version = self.version
+        if version == self.rendered_version:
+            return
+        new_message = await update_progress(self.message, self.build_message())
+        if new_message:
+            self.message = new_message
+        self.rendered_version = version
+
+    def mark_changed(self):
+        self.version += 1
+
+    def build_message(self):
         elapsed_time = (datetime.now() - self.start_time).total_seconds()
         
         # 构建进度消息
         message_lines = [
             "```",
-            "🔄 爬取进度",
+            self.title,
             "──────────────────────────",
             f"总帖子数：{self.total_posts}",
             f"已处理：{self.processed_posts}/{self.total_posts} {self.get_progress_bar(self.processed_posts/self.total_posts*100 if self.total_posts else 0)}",
@@ -117,19 +264,24 @@ class DiscordScraperCallback:
             "──────────────────────────"
         ]
 
-        # 如果正在下载，显示当前文件和进度
-        if self.current_file and self.download_progress > 0:
-            message_lines.extend([
-                "📥 当前下载",
-                f"文件：{self.current_file}",
-                f"进度：{self.get_progress_bar(self.download_progress)}",
-                "──────────────────────────"
-            ])
+        # 显示所有正在进行的下载
+        if self.active_downloads:
+            downloads = list(self.active_downloads.items())
+            message_lines.append(f"📥 正在下载（{len(downloads)}）")
+            for filename, progress in downloads[:self.max_listed_downloads]:
+                message_lines.extend([
+                    f"文件：{filename}",
+                    f"进度：{self.get_progress_bar(progress)}"
+                ])
+            if len(downloads) > self.max_listed_downloads:
+                message_lines.append(f"……另有 {len(downloads) - self.max_listed_downloads} 个文件")
+            message_lines.append("──────────────────────────")
 
         # 如果正在同步，显示同步状态
         if self.sync_status:
             message_lines.extend([
                 "☁️ Dropbox同步",
+                f"已同步：{self.synced_videos}",
                 f"状态：{self.sync_status}",
                 "──────────────────────────"
             ])
@@ -139,118 +291,173 @@ class DiscordScraperCallback:
             "```"
         ])
 
-        await update_progress(self.message, "\n".join(message_lines))
+        return "\n".join(message_lines)
 
     async def on_scraping_start(self, total_posts):
         """开始抓取时的回调"""
         self.total_posts = total_posts
-        current_time = datetime.now()
-        if (current_time - self.last_update_time).total_seconds() >= self.update_interval:
-            await self.update_progress()
-            self.last_update_time = current_time
+        self.mark_changed()
 
     async def on_post_processed(self, current_num, skipped=False):
         """处理完一个帖子的回调"""
         if not skipped:
             self.processed_posts = current_num
-        current_time = datetime.now()
-        if (current_time - self.last_update_time).total_seconds() >= self.update_interval:
-            await self.update_progress()
-            self.last_update_time = current_time
+            self.mark_changed()
 
     async def on_video_found(self, count):
         """发现视频时的回调"""
         self.total_videos += count
-        current_time = datetime.now()
-        if (current_time - self.last_update_time).total_seconds() >= self.update_interval:
-            await self.update_progress()
-            self.last_update_time = current_time
+        self.mark_changed()
 
     async def on_video_download_progress(self, filename, progress):
         """更新视频下载进度"""
-        self.current_file = filename
-        self.download_progress = progress
-        
-        # 检查是否达到更新间隔
-        current_time = datetime.now()
-        if (current_time - self.last_update_time).total_seconds() >= self.update_interval:
-            await self.update_progress()
-            self.last_update_time = current_time
+        self.active_downloads[filename] = progress
+        self.mark_changed()
 
     async def on_video_downloaded(self, filename):
         """视频下载完成的回调"""
         self.downloaded_videos += 1
-        self.current_file = ""
-        self.download_progress = 0
-        current_time = datetime.now()
-        if (current_time - self.last_update_time).total_seconds() >= self.update_interval:
-            await self.update_progress()
-            self.last_update_time = current_time
+        self.active_downloads.pop(filename, None)
+        self.mark_changed()
+
+    async def on_video_failed(self, filename):
+        """视频下载失败的回调"""
+        self.active_downloads.pop(filename, None)
+        self.mark_changed()
 
     async def on_video_synced(self, filename, success, message):
         """视频同步完成的回调"""
-        self.synced_videos += 1
         self.sync_status = f"{'✅' if success else '❌'} {message}"
         if success:
             self.synced_videos += 1
-        current_time = datetime.now()
-        if (current_time - self.last_update_time).total_seconds() >= self.update_interval:
-            await self.update_progress()
-            self.last_update_time = current_time
+        self.mark_changed()
+
+class DiscordSyncCallback(DiscordScraperCallback):
+    """手动同步的进度回调，与爬取进度一样由后台任务按固定间隔编辑消息"""
+    def __init__(self, message, update_interval=8, title="📤 同步到 Dropbox"):
+        super().__init__(message, update_interval, title)
+        self.failed_videos = 0
+
+    def build_message(self):
+        elapsed_time = (datetime.now() - self.start_time).total_seconds()
+        return "\n".join([
+            "```",
+            self.title,
+            "──────────────────────────",
+            f"成功：{self.synced_videos}",
+            f"失败：{self.failed_videos}",
+            f"最近：{self.sync_status}",
+            "──────────────────────────",
+            f"⏱️ 运行时间：{self.format_time(elapsed_time)}",
+            "```"
+        ])
+
+    async def on_video_synced(self, filename, success, message):
+        if not success:
+            self.failed_videos += 1
+        await super().on_video_synced(filename, success, f"{os.path.basename(filename)}: {message}")
 
 @bot.event
 async def on_ready():
     """Bot启动时的处理"""
     print(f'{bot.user} 已连接到Discord!')
-    global current_task, scraping_task
-    current_task = None  # 重置任务状态
+    global metrics_runner, dropbox_connect_task
+
+    # 启动本地指标导出（重连时不重复启动）
+    if config.metrics_port and metrics_runner is None:
+        try:
+            metrics_runner = await start_exporter(metrics, port=config.metrics_port)
+            print(f"指标导出: http://127.0.0.1:{config.metrics_port}/metrics")
+        except OSError as e:
+            print(f"启动指标导出失败: {e}")
     
-    # 根据配置的间隔设置定时任务
-    scraping_task.change_interval(minutes=config.interval_minutes)
+    if dropbox_sync and dropbox_sync.hash_catalog is None:
+        dropbox_sync.hash_catalog = get_hash_catalog()
+    # Dropbox 客户端在后台初始化（刷新令牌、测试连接），失败时下次重连再试
+    if dropbox_sync and (dropbox_connect_task is None or (dropbox_connect_task.done() and not dropbox_connect_task.result())):
+        dropbox_connect_task = asyncio.create_task(dropbox_sync.connect())
+
+    download_controller.start()
     if not scraping_task.is_running():
         scraping_task.start()
 
-@tasks.loop(minutes=1)
+@tasks.loop(seconds=30)
 async def scraping_task():
-    """定时任务"""
-    global current_task
-    
-    if not current_task or current_task.done():
-        channel = bot.get_channel(CHANNEL_ID)
-        if channel:
-            message = await channel.send("准备开始新的爬取任务...")
-            current_task = asyncio.create_task(run_scraper(message))
+    """定时检查各来源，启动到期的抓取"""
+    scheduler.update_sources(config.get_sources())
+    scheduler.tick()
+
+def get_scraper():
+    """所有来源共用一个爬虫实例（连接池、浏览器池和历史记录）"""
+    global scraper_instance
+    if not scraper_instance:
+        scraper_instance = CoomerScraper(
+            fetch_mode=config.fetch_mode,
+            per_host_limit=config.per_host_limit,
+            post_concurrency=config.post_concurrency,
+            hash_catalog=get_hash_catalog(),
+            browser_pool_size=config.browser_pool_size,
+            browser_max_pages=config.browser_max_pages,
+            browser_max_memory_mb=config.browser_max_memory_mb,
+            max_listing_pages=config.max_listing_pages,
+            download_concurrency=config.download_concurrency,
+            download_slots=download_slots,
+            limiter=bandwidth_limiter,
+            controller=download_controller,
+            retry_attempts=config.retry_attempts,
+            retry_max_delay=config.retry_max_delay,
+            preallocate_downloads=config.preallocate_downloads,
+            staging_quota_gb=config.staging_quota_gb,
+            min_free_disk_gb=config.min_free_disk_gb
+        )
+    return scraper_instance
+
+async def run_source(job, backfill=False, max_pages=None):
+    """
+    运行一个来源的抓取，由 SourceScheduler 调用
+    :param job: SourceJob
+    :param backfill: 是否忽略已知帖子继续向后翻页
+    :param max_pages: 最多抓取的列表页数
+    """
+    channel = bot.get_channel(CHANNEL_ID)
+    if not channel:
+        return
+
+    scraper = get_scraper()
+    # 没有其他来源在运行时开始新一轮指标统计
+    if len(scheduler.running_jobs()) == 1:
+        metrics.start_run()
+    progress_message = await channel.send(f"🔄 [{job.name}] 初始化爬虫...")
+    callback = DiscordScraperCallback(progress_message, title=f"🔄 爬取进度 - {job.name}")
+    callback.start()
 
-async def run_scraper(message):
-    """运行爬虫"""
-    global scraper_instance, current_task, progress_message
-    
     try:
-        # 暂停定时任务
-        scraping_task.cancel()
-        
-        progress_message = await message.channel.send("🔄 初始化爬虫...")
-        callback = DiscordScraperCallback(progress_message)
-        
-        # 创建新的爬虫实例
-        if not scraper_instance:
-            scraper_instance = CoomerScraper()
-        
-        try:
-            for url_name, url in config.urls.items():
-                posts = await scraper_instance.run_async(url, callback)
-                if posts:
-                    # 下载视频并自动同步到 Dropbox
-                    await scraper_instance.download_all_videos(posts, callback, dropbox_sync)
-        except Exception as e:
-            await message.channel.send(f"❌ 爬虫运行出错: {str(e)}")
-        finally:
-            scraper_instance.cleanup()
+        # 帖子解析、视频下载和 Dropbox 上传同时进行，下载名额在所有来源之间按优先级分配
+        pipeline = ScrapePipeline(
+            scraper,
+            dropbox_sync=dropbox_sync if config.auto_sync else None,
+            callback=callback,
+            # 自适应时由共享名额限制同时下载数，下载任务数按上限启动，否则调高名额也用不上
+            download_concurrency=config.max_total_downloads if config.adaptive_downloads else job.download_concurrency,
+            upload_concurrency=config.upload_concurrency,
+            backfill=backfill,
+            max_pages=max_pages,
+            download_slots=download_slots,
+            priority=job.priority
+        )
+        await pipeline.run([job.url])
+    except Exception as e:
+        await channel.send(f"❌ [{job.name}] 爬虫运行出错: {str(e)}")
+        raise
     finally:
-        current_task = None  # 任务完成后重置状态
-        # 重新启动定时任务
-        if not scraping_task.is_running():
-            scraping_task.start()
+        await callback.stop()
+        # 其他来源还在运行时保留连接池
+        if len(scheduler.running_jobs()) == 1:
+            await scraper.cleanup()
+        else:
+            scraper.history.flush()
+
+scheduler = SourceScheduler(run_source)
 
 async def sync_videos(directory):
     """同步视频到 Dropbox"""
@@ -259,14 +466,22 @@ async def sync_videos(directory):
     
     channel = bot.get_channel(CHANNEL_ID)
     message = await channel.send("🔄 开始同步视频到 Dropbox...")
+    staging = get_scraper().staging
+    progress = DiscordSyncCallback(message)
+    progress.start()
     
     async def sync_callback(filename, success, status):
-        await update_progress(message, 
-            f"{'✅' if success else '❌'} {os.path.basename(filename)}: {status}")
+        if success:
+            # 已上传的文件在空间不足时可以删除
+            staging.mark_synced(os.path.basename(filename))
+        await progress.on_video_synced(filename, success, status)
     
-    success, failed = await dropbox_sync.sync_directory(directory, sync_callback)
+    try:
+        success, failed = await dropbox_sync.sync_directory(directory, sync_callback)
+    finally:
+        await progress.stop()
     
-    await update_progress(message, 
+    await update_progress(progress.message, 
         f"📤 同步完成!\n"
         f"成功: {success} 个文件\n"
         f"失败: {failed} 个文件")
@@ -278,14 +493,41 @@ async def sync_command(ctx):
         await ctx.send("❌ Dropbox 未配置")
         return
     
-    for url_name in config.urls.keys():
-        directory = os.path.join(
-            os.path.dirname(os.path.abspath(__file__)), 
-            'downloads',
-            url_name
-        )
-        if os.path.exists(directory):
-            await sync_videos(directory)
+    # 所有来源的视频都下载到同一个目录
+    scraper = get_scraper()
+    await sync_videos(scraper.download_dir)
+    scraper.staging.trim()
+
+@bot.command(name='pin')
+async def pin_command(ctx, filename: str):
+    """固定本地文件，空间不足时也不删除"""
+    if get_scraper().staging.pin(filename):
+        await ctx.send(f"📌 已固定: {filename}")
+    else:
+        await ctx.send(f"❌ 下载目录中没有 {filename}")
+
+@bot.command(name='unpin')
+async def unpin_command(ctx, filename: str):
+    """取消固定本地文件"""
+    if get_scraper().staging.pin(filename, pinned=False):
+        await ctx.send(f"✅ 已取消固定: {filename}")
+    else:
+        await ctx.send(f"❌ 下载目录中没有 {filename}")
+
+@bot.command(name='quota')
+async def quota_command(ctx, gigabytes: float = None):
+    """查看或设置下载目录的空间配额（GB），0 表示不限制"""
+    staging = get_scraper().staging
+    if gigabytes is not None:
+        if gigabytes < 0:
+            await ctx.send("❌ 配额不能为负数")
+            return
+        config.staging_quota_gb = gigabytes
+        config.save_config()
+        staging.quota = int(gigabytes * GiB)
+        staging.notify()
+        staging.trim()
+    await ctx.send(format_staging(staging.summary()))
 
 @bot.command(name='autosync')
 async def autosync_command(ctx, enable: bool):
@@ -301,7 +543,7 @@ async def storage_command(ctx):
         await ctx.send("❌ Dropbox 未配置")
         return
     
-    used, total = dropbox_sync.get_storage_usage()
+    used, total = await dropbox_sync.get_storage_usage()
     if used is None or total is None:
         await ctx.send("❌ 获取存储信息失败")
         return
@@ -326,14 +568,9 @@ async def set_interval(ctx, minutes: int):
     
     config.interval_minutes = minutes
     config.save_config()
+    scheduler.update_sources(config.get_sources())
     
-    # 取消当前任务
-    scraping_task.cancel()
-    # 使用新的间隔重新启动任务
-    scraping_task.change_interval(minutes=minutes)
-    scraping_task.start()
-    
-    await ctx.send(f"✅ 已设置爬取间隔为 {minutes} 分钟")
+    await ctx.send(f"✅ 已设置爬取间隔为 {minutes} 分钟（单独设置了间隔的来源除外）")
 
 @bot.command(name='addurl')
 async def add_url(ctx, name: str, url: str):
@@ -369,16 +606,196 @@ async def list_urls(ctx):
         message += f"- {name}: {url}\n"
     await ctx.send(message)
 
+@bot.command(name='backfill')
+async def backfill_command(ctx, name: str, pages: int = 50):
+    """向后翻页补抓指定 URL 的历史帖子"""
+    if name not in config.urls:
+        await ctx.send("❌ 未找到指定的URL")
+        return
+    if pages < 1:
+        await ctx.send("❌ 页数必须大于0")
+        return
+
+    scheduler.update_sources(config.get_sources())
+    if not scheduler.trigger(name, backfill=True, max_pages=pages):
+        await ctx.send(f"❌ {name} 正在运行，请稍后再试")
+        return
+    await ctx.send(f"🔄 开始补抓 {name}，最多 {pages} 页...")
+
+@bot.command(name='setsource')
+async def set_source(ctx, name: str, minutes: int, priority: int = 0, concurrency: int = None):
+    """设置来源的单独爬取间隔（分钟）、优先级和同时下载数"""
+    if name not in config.urls:
+        await ctx.send("❌ 未找到指定的URL")
+        return
+    if minutes < 1:
+        await ctx.send("❌ 间隔时间必须大于1分钟")
+        return
+
+    settings = {'interval_minutes': minutes, 'priority': priority}
+    if concurrency:
+        settings['download_concurrency'] = concurrency
+    config.sources[name] = settings
+    config.save_config()
+    scheduler.update_sources(config.get_sources())
+
+    source = config.get_sources()[name]
+    await ctx.send(
+        f"✅ 已设置 {name}: 间隔 {source['interval_minutes']} 分钟，"
+        f"优先级 {source['priority']}，同时下载 {source['download_concurrency']} 个"
+    )
+
+@bot.command(name='bandwidth')
+async def bandwidth_command(ctx, mb_per_second: float = None):
+    """查看或设置下载和上传共用的带宽上限（MB/秒），0 表示不限速"""
+    if mb_per_second is None:
+        limit = f"{config.max_bandwidth_mb} MB/秒" if config.max_bandwidth_mb else "不限速"
+        await ctx.send(f"📶 带宽上限: {limit}")
+        return
+    if mb_per_second < 0:
+        await ctx.send("❌ 带宽上限不能为负数")
+        return
+
+    config.max_bandwidth_mb = mb_per_second
+    config.save_config()
+    bandwidth_limiter.set_rate(mb_per_second * 1024**2)
+    await ctx.send(f"✅ 带宽上限已设置为 {f'{mb_per_second} MB/秒' if mb_per_second else '不限速'}")
+
+@bot.command(name='concurrency')
+async def concurrency_command(ctx, downloads: int = None):
+    """查看或设置所有来源合计的最大同时下载数"""
+    if downloads is not None:
+        if downloads < 1:
+            await ctx.send("❌ 同时下载数必须大于0")
+            return
+        config.max_total_downloads = downloads
+        config.save_config()
+        download_controller.set_bounds(max_limit=downloads)
+        if not config.adaptive_downloads:
+            download_controller.set_limit(downloads)
+
+    mode = f"自适应（1-{config.max_total_downloads}）" if config.adaptive_downloads else "固定"
+    await ctx.send(
+        f"⚡ 同时下载数: {download_slots.limit}，模式: {mode}\n"
+        f"正在下载: {download_slots.in_use()}，等待中: {len(download_slots.waiters)}"
+    )
+
+@bot.command(name='adaptive')
+async def adaptive_command(ctx, enable: bool):
+    """设置是否自动调整同时下载数"""
+    config.adaptive_downloads = enable
+    config.save_config()
+    download_controller.enabled = enable
+    if not enable:
+        download_controller.set_limit(config.max_total_downloads)
+    await ctx.send(f"{'✅' if enable else '❌'} 自适应下载并发已{'开启' if enable else '关闭'}")
+
+def format_metric_value(name, value):
+    if value is None:
+        return "-"
+    if name.endswith('_seconds'):
+        return f"{value:.2f}s"
+    if name.endswith('_bytes_per_second'):
+        return f"{value / (1024**2):.2f}MB/s"
+    return f"{value:.0f}"
+
+@bot.command(name='metrics')
+async def metrics_command(ctx):
+    """显示最近一次运行的性能指标"""
+    summary = metrics.summary()
+    if not summary['samples'] and not summary['counters']:
+        await ctx.send("暂无指标数据")
+        return
+
+    started = datetime.fromtimestamp(summary['run_started']).strftime('%Y-%m-%d %H:%M:%S')
+    lines = ["```", f"📈 最近一次运行指标（开始于 {started}）", "──────────────────────────"]
+    for name, stats in sorted(summary['samples'].items()):
+        lines.append(
+            f"{name}: n={stats['count']} "
+            f"p50={format_metric_value(name, stats['p50'])} "
+            f"p95={format_metric_value(name, stats['p95'])}"
+        )
+    if summary['counters']:
+        lines.append("──────────────────────────")
+        for name, value in sorted(summary['counters'].items()):
+            if name.endswith('_bytes'):
+                lines.append(f"{name}: {value / (1024**2):.1f}MB")
+            else:
+                lines.append(f"{name}: {value}")
+    lines.append("```")
+    await ctx.send("\n".join(lines))
+
 @bot.command(name='status')
 async def status(ctx):
     """显示当前状态"""
-    message = (
-        f"⚙️ 当前配置:\n"
-        f"爬取间隔: {config.interval_minutes} 分钟\n"
-        f"URL数量: {len(config.urls)}\n"
-        f"下次爬取: {scraping_task.next_iteration.strftime('%Y-%m-%d %H:%M:%S') if scraping_task.next_iteration else '未调度'}"
+    scheduler.update_sources(config.get_sources())
+    lines = [
+        "⚙️ 当前配置:",
+        f"默认爬取间隔: {config.interval_minutes} 分钟",
+        f"URL数量: {len(config.urls)}",
+        f"全局同时下载数: {download_slots.limit}"
+        + (f"（自适应，上限 {config.max_total_downloads}）" if config.adaptive_downloads else ""),
+        f"带宽上限: {f'{config.max_bandwidth_mb} MB/秒' if config.max_bandwidth_mb else '不限速'}",
+        "",
+        "📋 来源:"
+    ]
+    for job in sorted(scheduler.jobs.values(), key=lambda job: (-job.priority, job.name)):
+        if job.running:
+            state = f"运行中（已运行 {format_duration(time.time() - job.last_started)}）"
+        else:
+            state = f"下次爬取 {datetime.fromtimestamp(job.next_run).strftime('%Y-%m-%d %H:%M:%S')}"
+        last = format_duration(job.last_duration) if job.last_duration is not None else '-'
+        lines.append(
+            f"- {job.name}: 每 {job.interval_minutes} 分钟，优先级 {job.priority}，{state}，上次耗时 {last}"
+            + (f"，上次出错: {job.last_error}" if job.last_error else "")
+        )
+
+    if scraper_instance:
+        lines.extend(["", format_staging(scraper_instance.staging.summary())])
+        counts = scraper_instance.jobs.count_by_state()
+        lines.extend([
+            "",
+            "📦 视频任务: " + "，".join(f"{JOB_STATE_NAMES[state]} {count}" for state, count in counts.items())
+        ])
+
+    paused = {}
+    if scraper_instance:
+        paused.update(scraper_instance.breaker.open_keys())
+    if dropbox_sync and dropbox_sync.retry.breaker:
+        paused.update(dropbox_sync.retry.breaker.open_keys())
+    if paused:
+        lines.extend(["", "⛔ 暂停请求（连续失败）:"])
+        lines.extend(f"- {host}: {remaining:.0f} 秒后重试" for host, remaining in paused.items())
+    await ctx.send("\n".join(lines))
+
+JOB_STATE_NAMES = {
+    'discovered': '待下载',
+    'downloading': '下载中',
+    'downloaded': '已下载',
+    'uploading': '上传中',
+    'synced': '已完成',
+    'failed': '失败'
+}
+
+def format_staging(summary):
+    if not summary['quota']:
+        quota = "不限"
+    elif summary['uploads']:
+        quota = f"{summary['quota'] / GiB:.1f} GB"
+    else:
+        quota = f"{summary['quota'] / GiB:.1f} GB（未上传时不限制）"
+    text = (
+        f"💾 下载目录: {summary['usage'] / GiB:.2f} GB / {quota}，磁盘剩余 {summary['free'] / GiB:.1f} GB\n"
+        f"待上传 {summary['pending']}，已上传 {summary['synced']}，已固定 {summary['pinned']}"
     )
-    await ctx.send(message)
+    if summary['waiting']:
+        text += f"\n⏸️ {summary['waiting']} 个下载因空间不足暂停"
+    return text
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}小时{minutes}分{seconds}秒" if hours else f"{minutes}分{seconds}秒"
 
 if __name__ == '__main__':
     max_retries = 3
@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import time
+from urllib.parse import urlparse
+
+
+def video_fingerprint(url):
+    """去掉主机和查询参数后的 URL 路径，同一文件在不同数据节点上的地址相同"""
+    return urlparse(url).path
+
+
+class DedupIndex:
+    """
+    内存中的去重索引，启动时从历史记录构建一次，之后增量更新
+
+    posts: post_id -> 视频指纹集合
+    locations: 视频指纹 -> 首次出现该视频的 post_id
+    只按 URL 路径判断，显示名称相同（如 1.mp4）的不同附件不算重复
+    """
+
+    def __init__(self):
+        self.posts = {}
+        self.locations = {}
+
+    @classmethod
+    def from_history(cls, history):
+        index = cls()
+        for post_id in history.iter_posts():
+            index.posts[post_id] = set()
+        for post_id, url, filename in history.iter_videos():
+            index.add_video(post_id, {'url': url, 'filename': filename})
+        return index
+
+    def is_post_scraped(self, post_id, post_data=None):
+        """
+        判断帖子是否已处理过
+        帖子页尚未抓取（没有视频列表）时，已知帖子直接视为已处理，避免再次请求帖子页
+        """
+        fingerprints = self.posts.get(post_id)
+        if fingerprints is None:
+            return False
+        videos = (post_data or {}).get('videos')
+        if not videos:
+            return True
+        return fingerprints == set(video_fingerprint(v['url']) for v in videos)
+
+    def find_video(self, video):
+        """返回已记录该视频的 post_id，未记录时返回 None"""
+        if not video.get('url'):
+            return None
+        return self.locations.get(video_fingerprint(video['url']))
+
+    def add_post(self, post_id, post_data):
+        self.posts.setdefault(post_id, set())
+        for video in post_data.get('videos', []):
+            self.add_video(post_id, video)
+
+    def add_video(self, post_id, video):
+        if video.get('url'):
+            fingerprint = video_fingerprint(video['url'])
+            self.posts.setdefault(post_id, set()).add(fingerprint)
+            self.locations.setdefault(fingerprint, post_id)
+
+
+PARTIAL_HASH_BYTES = 1024 * 1024
+
+
+def partial_hash(path, size):
+    """文件大小 + 首尾各 1 MiB 的 SHA-256，用于快速排除内容不同的文件"""
+    sha = hashlib.sha256(str(size).encode('ascii'))
+    with open(path, 'rb') as f:
+        sha.update(f.read(PARTIAL_HASH_BYTES))
+        if size > PARTIAL_HASH_BYTES:
+            f.seek(max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES))
+            sha.update(f.read(PARTIAL_HASH_BYTES))
+    return sha.hexdigest()
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+async def _run_blocking(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, *args)
+
+
+class HashCatalog:
+    """
+    本地内容哈希目录，记录已下载/已上传文件的内容指纹
+
+    先比较文件大小和首尾部分哈希，只有出现候选时才计算完整 SHA-256，
+    完整哈希在需要时才补算并写回目录。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS content_hashes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            size INTEGER NOT NULL,
+            partial TEXT NOT NULL,
+            sha256 TEXT,
+            filename TEXT,
+            local_path TEXT,
+            dropbox_path TEXT,
+            created_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_content_partial ON content_hashes(size, partial);
+        CREATE INDEX IF NOT EXISTS idx_content_sha256 ON content_hashes(sha256);
+        CREATE INDEX IF NOT EXISTS idx_content_local_path ON content_hashes(local_path);
+    """
+
+    COLUMNS = ('id', 'size', 'partial', 'sha256', 'filename', 'local_path', 'dropbox_path')
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+
+    async def fingerprint(self, path, sha256=None):
+        """计算文件的大小和部分哈希，sha256 为下载时已算出的完整哈希"""
+        size = os.path.getsize(path)
+        partial = await _run_blocking(partial_hash, path, size)
+        return {'size': size, 'partial': partial, 'sha256': sha256}
+
+    async def find_duplicate(self, path, fingerprint):
+        """
+        查找与文件内容相同的其他记录
+        :return: 目录记录，没有重复时返回 None
+        """
+        candidates = [
+            entry for entry in self._select(
+                'WHERE size = ? AND partial = ?', (fingerprint['size'], fingerprint['partial'])
+            )
+            if entry['local_path'] != path
+        ]
+        if not candidates:
+            return None
+
+        if fingerprint['sha256'] is None:
+            fingerprint['sha256'] = await _run_blocking(file_hash, path)
+        for entry in candidates:
+            if entry['sha256'] is None:
+                # 原文件已被删除时无法确认，不视为重复
+                if not entry['local_path'] or not os.path.exists(entry['local_path']):
+                    continue
+                entry['sha256'] = await _run_blocking(file_hash, entry['local_path'])
+                self._update(entry['id'], sha256=entry['sha256'])
+            if entry['sha256'] == fingerprint['sha256']:
+                return entry
+        return None
+
+    def add(self, path, fingerprint):
+        """记录新文件，同一本地路径之前的记录不再指向该路径"""
+        with self.conn:
+            self.conn.execute('UPDATE content_hashes SET local_path = NULL WHERE local_path = ?', (path,))
+            cursor = self.conn.execute(
+                'INSERT INTO content_hashes (size, partial, sha256, filename, local_path, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (fingerprint['size'], fingerprint['partial'], fingerprint['sha256'],
+                 os.path.basename(path), path, time.time())
+            )
+        return cursor.lastrowid
+
+    def find_by_path(self, path):
+        entries = self._select('WHERE local_path = ? ORDER BY id DESC LIMIT 1', (path,))
+        return entries[0] if entries else None
+
+    async def mark_uploaded(self, entry, dropbox_path):
+        """
+        记录文件已上传，本地文件随后可能被删除，所以先补算完整哈希
+        """
+        if entry['sha256'] is None and entry['local_path'] and os.path.exists(entry['local_path']):
+            entry['sha256'] = await _run_blocking(file_hash, entry['local_path'])
+        entry['dropbox_path'] = dropbox_path
+        self._update(entry['id'], sha256=entry['sha256'], dropbox_path=dropbox_path)
+
+    def close(self):
+        self.conn.close()
+
+    def _select(self, where, params):
+        rows = self.conn.execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM content_hashes {where}", params
+        ).fetchall()
+        return [dict(zip(self.COLUMNS, row)) for row in rows]
+
+    def _update(self, entry_id, **fields):
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self.conn:
+            self.conn.execute(
+                f"UPDATE content_hashes SET {assignments} WHERE id = ?",
+                (*fields.values(), entry_id)
+            )
@@ -0,0 +1,363 @@
+import asyncio
+import errno
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import aiohttp
+from retry import RetryPolicy
+
+MiB = 1024 * 1024
+# 文件大小未知时，每下载这么多字节报告一次进度
+UNKNOWN_SIZE_PROGRESS_STEP = 4 * MiB
+# 单次 pwritev 最多的数据块数（低于常见的 IOV_MAX 1024）
+MAX_IOVECS = 512
+
+
+class DownloadError(Exception):
+    pass
+
+
+class SegmentedDownloader:
+    """
+    支持断点续传的分段下载器
+
+    服务器支持 Range 请求时，大文件被拆分为多个字节区间并行下载，按偏移量写入预分配的
+    .part 文件；.part.json 记录每个区间已写入的字节数，中断后可从断点继续。
+    全部完成后才重命名为最终文件。
+
+    收到的数据攒成块后交给专用的 I/O 线程写入（同时计算哈希），磁盘延迟不会阻塞事件循环。
+    块大小从 chunk_size 开始，链路快时翻倍直到 max_chunk_size，慢时减半。
+    """
+
+    def __init__(self, session_manager, chunk_size=64 * 1024, min_segment_size=8 * MiB,
+                 max_segments=4, segment_retries=3, checkpoint_bytes=4 * MiB, limiter=None, controller=None,
+                 retry=None, max_chunk_size=4 * MiB, fallocate=True, progress_step=1, staging=None):
+        """
+        :param session_manager: 共享的 SessionManager
+        :param chunk_size: 最小写入块大小（字节）
+        :param min_segment_size: 每个分段的最小字节数，小于两倍该值的文件不分段
+        :param max_segments: 单个文件的最大并行分段数
+        :param segment_retries: 未传入 retry 时单个分段的最大尝试次数
+        :param checkpoint_bytes: 每写入多少字节保存一次断点信息
+        :param limiter: 共享的 TokenBucket 限速器
+        :param controller: AdaptiveConcurrency，用于统计下载吞吐量
+        :param retry: 分段请求使用的 RetryPolicy
+        :param max_chunk_size: 最大写入块大小（字节）
+        :param fallocate: 是否用 posix_fallocate 预先分配磁盘空间，不支持时使用稀疏文件
+        :param progress_step: 进度每增加多少百分比报告一次
+        :param staging: StagingArea，新文件分配空间前先申请，空间不足时等待
+        """
+        self.session_manager = session_manager
+        self.chunk_size = chunk_size
+        self.min_segment_size = min_segment_size
+        self.max_segments = max_segments
+        self.segment_retries = segment_retries
+        self.checkpoint_bytes = checkpoint_bytes
+        self.limiter = limiter
+        self.controller = controller
+        self.retry = retry or RetryPolicy(attempts=segment_retries, name='download')
+        self.max_chunk_size = max_chunk_size
+        self.fallocate = fallocate
+        self.progress_step = progress_step
+        self.staging = staging
+        # 单个线程按提交顺序写入，没有 pwrite 的平台上 seek + write 也不会交错
+        self.io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='download-io')
+
+    async def probe(self, url):
+        """
+        通过 HEAD 请求获取文件大小和是否支持 Range
+        :return: (文件大小, 是否支持 Range)，获取失败时为 (0, False)
+        """
+        session = await self.session_manager.get_session()
+        try:
+            async with session.head(url, allow_redirects=True) as response:
+                if response.status != 200:
+                    return 0, False
+                size = int(response.headers.get('Content-Length', 0))
+                ranged = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+                return size, ranged and size > 0
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return 0, False
+
+    def plan_segments(self, size, ranged):
+        """将文件按大小拆分为若干区间，end 为包含在内的结束偏移"""
+        if not ranged:
+            return [{'start': 0, 'end': size - 1 if size else None, 'done': 0}]
+        count = max(1, min(self.max_segments, size // self.min_segment_size))
+        step = size // count
+        segments = []
+        for i in range(count):
+            start = i * step
+            end = size - 1 if i == count - 1 else start + step - 1
+            segments.append({'start': start, 'end': end, 'done': 0})
+        return segments
+
+    def load_state(self, state_path, url, size):
+        """读取断点信息，与当前文件不匹配时返回 None"""
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('url') != url or state.get('size') != size:
+            return None
+        return state
+
+    def save_state(self, state_path, state):
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+    def preallocate(self, part_path, size):
+        """创建 .part 文件并分配空间，在 I/O 线程中执行"""
+        with open(part_path, 'wb') as f:
+            if not size:
+                return
+            if self.fallocate and hasattr(os, 'posix_fallocate'):
+                try:
+                    # 一次分配连续空间，减少碎片，磁盘空间不足时立即失败
+                    os.posix_fallocate(f.fileno(), 0, size)
+                    return
+                except OSError as e:
+                    if e.errno == errno.ENOSPC:
+                        raise
+            f.truncate(size)
+
+    async def download(self, url, file_path, progress=None, hasher=None):
+        """
+        下载文件到 file_path
+        :param url: 文件地址
+        :param file_path: 最终保存路径
+        :param progress: 异步进度回调 progress(已下载字节数, 总字节数)
+        :param hasher: hashlib 对象，文件按顺序从头下载时边写边计算哈希
+        :return: (文件字节数, 哈希十六进制值)，分段或续传下载时哈希为 None
+        """
+        part_path = file_path + '.part'
+        state_path = part_path + '.json'
+
+        size, ranged = await self.probe(url)
+        state = self.load_state(state_path, url, size) if ranged and os.path.exists(part_path) else None
+        if state:
+            print(f"从断点继续下载: {os.path.basename(file_path)}")
+        else:
+            state = {'url': url, 'size': size, 'segments': self.plan_segments(size, ranged)}
+            if self.staging:
+                await self.staging.admit(size)
+            try:
+                await asyncio.get_running_loop().run_in_executor(self.io_executor, self.preallocate, part_path, size)
+            finally:
+                # 分配后 .part 文件已计入目录占用
+                if self.staging:
+                    self.staging.release(size)
+            if ranged:
+                self.save_state(state_path, state)
+
+        tracker = _ProgressTracker(size, sum(s['done'] for s in state['segments']), progress, self.progress_step)
+        # 只有单个分段且从头开始时数据才按顺序到达
+        if len(state['segments']) != 1 or tracker.downloaded:
+            hasher = None
+
+        def checkpoint():
+            if ranged:
+                self.save_state(state_path, state)
+
+        fd = os.open(part_path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        tasks = [
+            asyncio.create_task(self.fetch_segment(url, fd, segment, ranged, tracker, checkpoint, hasher))
+            for segment in state['segments']
+            if not _segment_complete(segment)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            checkpoint()
+            raise
+        finally:
+            os.close(fd)
+
+        if size and tracker.downloaded != size:
+            raise DownloadError(f"文件大小不匹配: {tracker.downloaded}/{size}")
+
+        os.replace(part_path, file_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+        return tracker.downloaded, hasher.hexdigest() if hasher else None
+
+    async def fetch_segment(self, url, fd, segment, ranged, tracker, checkpoint, hasher=None):
+        """下载一个区间，可重试的错误按 RetryPolicy 退避后从已写入的位置继续"""
+        async def attempt():
+            try:
+                await self.stream_segment(url, fd, segment, ranged, tracker, checkpoint, hasher)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                checkpoint()
+                # 不支持 Range 时无法从中间继续，已计算的哈希也无法回退
+                if not ranged and segment['done']:
+                    raise DownloadError(f"下载中断: {e}") from e
+                raise
+
+        await self.retry.call(attempt, key=urlparse(url).netloc)
+
+    async def stream_segment(self, url, fd, segment, ranged, tracker, checkpoint, hasher=None):
+        headers = {}
+        if ranged:
+            offset = segment['start'] + segment['done']
+            headers['Range'] = f"bytes={offset}-{segment['end']}"
+        else:
+            tracker.downloaded -= segment['done']
+            segment['done'] = 0
+            offset = 0
+
+        session = await self.session_manager.get_session()
+        async with session.get(url, headers=headers) as response:
+            response.raise_for_status()
+            if ranged and response.status != 206:
+                raise DownloadError(f"服务器未返回分段内容: HTTP {response.status}")
+            if not tracker.total:
+                tracker.total = int(response.headers.get('Content-Length', 0))
+
+            writer = _SegmentWriter(self, fd, segment, offset, checkpoint, hasher)
+            try:
+                async for chunk in response.content.iter_any():
+                    if not chunk:
+                        continue
+                    await writer.write(chunk)
+                    if self.controller:
+                        self.controller.record_bytes(len(chunk))
+                    if self.limiter:
+                        await self.limiter.consume(len(chunk))
+                    await tracker.add(len(chunk))
+            finally:
+                # 出错时也写入已收到的数据，重试从这里继续
+                await writer.close()
+
+        if ranged and not _segment_complete(segment):
+            raise aiohttp.ClientPayloadError("分段数据不完整")
+
+
+    def close(self):
+        self.io_executor.shutdown(wait=True)
+
+
+class _SegmentWriter:
+    """
+    把一个分段收到的数据攒成块，交给 I/O 线程按偏移写入
+
+    同一分段同时最多有一个写入在进行，写入完成后才计入 segment['done']，
+    断点信息不会记录尚未落盘的数据。
+    """
+
+    def __init__(self, downloader, fd, segment, offset, checkpoint, hasher=None):
+        self.downloader = downloader
+        self.fd = fd
+        self.segment = segment
+        self.offset = offset
+        self.checkpoint = checkpoint
+        self.hasher = hasher
+        self.chunk_size = downloader.chunk_size
+        # 收到的数据块原样保存，写入时用 pwritev 一次写出，不再复制到同一个缓冲区
+        self.buffer = []
+        self.buffered = 0
+        self.pending = None
+        self.unsaved = 0
+        self.last_flush = time.monotonic()
+
+    async def write(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.chunk_size:
+            await self.flush()
+
+    async def flush(self):
+        now = time.monotonic()
+        elapsed = now - self.last_flush
+        self.last_flush = now
+        # 块很快就攒满说明链路快，加大块减少写入次数；攒得慢时减小，进度和断点更及时
+        if elapsed < 0.1:
+            self.chunk_size = min(self.downloader.max_chunk_size, self.chunk_size * 2)
+        elif elapsed > 1:
+            self.chunk_size = max(self.downloader.chunk_size, self.chunk_size // 2)
+
+        await self.wait()
+        chunks, size = self.buffer, self.buffered
+        self.buffer, self.buffered = [], 0
+        self.pending = asyncio.get_running_loop().run_in_executor(
+            self.downloader.io_executor, self.write_blocking, chunks, size, self.offset
+        )
+        self.offset += size
+
+    def write_blocking(self, chunks, size, offset):
+        if hasattr(os, 'pwritev') and len(chunks) <= MAX_IOVECS:
+            written = os.pwritev(self.fd, chunks, offset)
+            if written < size:
+                _write_at(self.fd, b''.join(chunks)[written:], offset + written)
+        else:
+            _write_at(self.fd, b''.join(chunks), offset)
+        if self.hasher:
+            for chunk in chunks:
+                self.hasher.update(chunk)
+        return size
+
+    async def wait(self):
+        """等待上一次写入完成并记录进度"""
+        if self.pending is None:
+            return
+        pending, self.pending = self.pending, None
+        written = await pending
+        self.segment['done'] += written
+        self.unsaved += written
+        if self.unsaved >= self.downloader.checkpoint_bytes:
+            self.checkpoint()
+            self.unsaved = 0
+
+    async def close(self):
+        if self.buffered:
+            await self.flush()
+        await self.wait()
+
+
+class _ProgressTracker:
+    """累计已下载的字节数，进度每增加 step% 才调用一次回调"""
+
+    def __init__(self, total, downloaded, callback, step=1):
+        self.total = total
+        self.downloaded = downloaded
+        self.callback = callback
+        self.step = step
+        self.reported = None
+
+    async def add(self, count):
+        self.downloaded += count
+        if not self.callback:
+            return
+        if self.total:
+            mark = int(self.downloaded * 100 / self.total // self.step)
+        else:
+            mark = self.downloaded // UNKNOWN_SIZE_PROGRESS_STEP
+        if mark != self.reported:
+            self.reported = mark
+            await self.callback(self.downloaded, self.total)
+
+
+def _segment_complete(segment):
+    if segment['end'] is None:
+        return False
+    return segment['done'] >= segment['end'] - segment['start'] + 1
+
+
+def _write_at(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            # Windows 没有 pwrite；所有写入都在同一个 I/O 线程上，seek + write 不会交错
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
@@ -0,0 +1,173 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from metrics import metrics
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MiB = 1024 * 1024
+
+
+def driver_memory_mb(driver):
+    """
+    浏览器占用的内存（MB）
+    安装了 psutil 时统计 chromedriver 及其子进程的 RSS，否则使用页面的 JS 堆大小
+    :return: 无法获取时返回 None
+    """
+    from selenium.common.exceptions import WebDriverException
+    if psutil is not None:
+        try:
+            process = psutil.Process(driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / MiB
+        except (psutil.Error, AttributeError):
+            pass
+    try:
+        heap = driver.execute_script('return performance.memory ? performance.memory.usedJSHeapSize : null')
+        return heap / MiB if heap else None
+    except WebDriverException:
+        return None
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.time()
+
+
+class DriverPool:
+    """
+    长期存活的 WebDriver 池
+
+    第一次需要浏览器时才启动 Chrome，实例在多次运行之间保留。空闲实例取出前先做健康检查，
+    失效的实例被替换；加载页面数达到 max_pages 或内存超过 max_memory_mb 的实例在归还时回收。
+    WebDriver 的阻塞调用在独立的线程池中执行，多个实例可以并行加载页面。
+    """
+
+    def __init__(self, factory, size=2, max_pages=50, max_memory_mb=1024):
+        """
+        :param factory: 创建 WebDriver 的函数，在线程池中调用
+        :param size: 最大实例数
+        :param max_pages: 每个实例加载多少个页面后回收
+        :param max_memory_mb: 实例内存超过该值（MB）时回收，为 None 时不检查
+        """
+        self.factory = factory
+        self.size = size
+        self.max_pages = max_pages
+        self.max_memory_mb = max_memory_mb
+        # 多一个线程用于退出被回收的实例，不占用加载页面的线程
+        self.executor = ThreadPoolExecutor(max_workers=size + 1, thread_name_prefix='webdriver')
+        self.idle = []
+        self.live = 0
+        self._semaphore = None
+
+    def get_semaphore(self):
+        # 在事件循环中创建，避免绑定到其他循环
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        return self._semaphore
+
+    async def run(self, func, *args):
+        """在线程池中执行阻塞的 WebDriver 调用"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def fetch(self, load_page, url):
+        """
+        取出一个实例执行 load_page(driver, url)
+        :return: load_page 的返回值
+        """
+        async with self.driver() as pooled:
+            pooled.pages += 1
+            return await self.run(load_page, pooled.driver, url)
+
+    @asynccontextmanager
+    async def driver(self):
+        """取出一个实例，WebDriver 出错（超时除外）时丢弃该实例"""
+        pooled = await self.acquire()
+        # 实例已在线程池中启动，selenium 已经导入
+        from selenium.common.exceptions import TimeoutException, WebDriverException
+        broken = False
+        try:
+            yield pooled
+        except TimeoutException:
+            raise
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            await self.release(pooled, broken)
+
+    async def acquire(self):
+        await self.get_semaphore().acquire()
+        try:
+            while self.idle:
+                pooled = self.idle.pop()
+                if await self.run(self.is_healthy, pooled.driver):
+                    return pooled
+                print("WebDriver 健康检查失败，替换实例")
+                metrics.inc('webdriver_unhealthy')
+                await self.discard(pooled)
+            return await self.start_driver()
+        except BaseException:
+            self.get_semaphore().release()
+            raise
+
+    async def release(self, pooled, broken=False):
+        try:
+            if broken or await self.should_recycle(pooled):
+                await self.discard(pooled)
+            else:
+                self.idle.append(pooled)
+        finally:
+            self.get_semaphore().release()
+
+    async def start_driver(self):
+        print("启动 WebDriver...")
+        start = time.perf_counter()
+        driver = await self.run(self.factory)
+        metrics.observe('webdriver_start_seconds', time.perf_counter() - start)
+        metrics.inc('webdriver_started')
+        self.live += 1
+        metrics.set_gauge('webdriver_live', self.live)
+        return PooledDriver(driver)
+
+    async def should_recycle(self, pooled):
+        if self.max_pages and pooled.pages >= self.max_pages:
+            print(f"WebDriver 已加载 {pooled.pages} 个页面，回收")
+            return True
+        if self.max_memory_mb:
+            memory = await self.run(driver_memory_mb, pooled.driver)
+            if memory is not None and memory > self.max_memory_mb:
+                print(f"WebDriver 内存 {memory:.0f}MB 超过 {self.max_memory_mb}MB，回收")
+                return True
+        return False
+
+    async def discard(self, pooled):
+        self.live -= 1
+        metrics.set_gauge('webdriver_live', self.live)
+        metrics.inc('webdriver_recycled')
+        try:
+            await self.run(pooled.driver.quit)
+        except Exception as e:
+            print(f"关闭 WebDriver 时出错: {e}")
+
+    def is_healthy(self, driver):
+        from selenium.common.exceptions import WebDriverException
+        try:
+            driver.execute_script('return 1')
+            return True
+        except WebDriverException:
+            return False
+
+    async def close(self):
+        """关闭所有空闲实例，之后再使用时重新启动"""
+        idle, self.idle = self.idle, []
+        for pooled in idle:
+            await self.discard(pooled)
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import time
+from metrics import metrics
+
+API_URL = 'https://api.dropboxapi.com'
+CONTENT_URL = 'https://content.dropboxapi.com'
+TOKEN_URL = 'https://api.dropboxapi.com/oauth2/token'
+
+
+class DropboxApiError(Exception):
+    """Dropbox 返回的业务错误（HTTP 409），如路径不存在、冲突，不应重试"""
+
+    def __init__(self, endpoint, summary, error=None):
+        super().__init__(f"{endpoint}: {summary}")
+        self.endpoint = endpoint
+        self.summary = summary or ''
+        self.error = error
+
+    def is_not_found(self):
+        return 'not_found' in self.summary
+
+
+class DropboxAuthError(Exception):
+    """访问令牌无效且无法刷新"""
+
+
+class DropboxClient:
+    """
+    基于 aiohttp 的 Dropbox HTTP API 客户端
+
+    RPC 端点（api.dropboxapi.com）以 JSON 收发；内容端点（content.dropboxapi.com）的参数放在
+    Dropbox-API-Arg 请求头中，请求体为文件数据。所有请求共用 SessionManager 的连接池。
+    提供 refresh token 时，后台任务在访问令牌过期前 refresh_margin 秒刷新；同一时间只有一个刷新请求，
+    并发的调用等待它的结果。令牌提前失效（401）时刷新后重试一次。重试和熔断由调用方的 RetryPolicy 负责。
+    """
+
+    def __init__(self, session_manager, access_token=None, refresh_token=None, app_key=None, app_secret=None,
+                 api_url=API_URL, content_url=CONTENT_URL, token_url=TOKEN_URL, refresh_margin=300):
+        """
+        :param session_manager: SessionManager，提供共享的 aiohttp 会话
+        :param access_token: 访问令牌，提供 refresh token 时可以为 None
+        :param refresh_token: 刷新令牌
+        :param app_key: Dropbox app key
+        :param app_secret: Dropbox app secret
+        :param api_url: RPC 端点的地址，测试时指向本地替身服务器
+        :param content_url: 上传端点的地址
+        :param token_url: 刷新令牌的地址
+        :param refresh_margin: 在过期前多少秒刷新访问令牌
+        """
+        self.session_manager = session_manager
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.app_key = app_key
+        self.app_secret = app_secret
+        self.api_url = api_url.rstrip('/')
+        self.content_url = content_url.rstrip('/')
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+        # 访问令牌的过期时间（time.monotonic），未知时为 None
+        self.expires_at = None
+        self.logger = logging.getLogger('DropboxSync')
+        self._refresh_lock = None
+        self._refresh_task = None
+
+    @property
+    def can_refresh(self):
+        return bool(self.refresh_token and self.app_key and self.app_secret)
+
+    def needs_refresh(self):
+        if not self.can_refresh:
+            return False
+        if self.access_token is None:
+            return True
+        return self.expires_at is not None and time.monotonic() >= self.expires_at - self.refresh_margin
+
+    def get_refresh_lock(self):
+        # 在事件循环中创建，避免绑定到其他循环
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        return self._refresh_lock
+
+    async def get_token(self):
+        """返回可用的访问令牌，后台刷新没有及时完成时在这里刷新"""
+        if self.needs_refresh():
+            await self.refresh(stale_token=self.access_token)
+        if self.access_token is None:
+            raise DropboxAuthError("没有可用的 Dropbox 访问令牌")
+        return self.access_token
+
+    async def refresh(self, stale_token=None):
+        """
+        用 refresh token 换取新的访问令牌
+        :param stale_token: 调用方拿到的（认为已失效的）令牌，等锁期间其他调用已经换过令牌时直接返回
+        """
+        async with self.get_refresh_lock():
+            if self.access_token != stale_token and not self.needs_refresh():
+                return
+            if not self.can_refresh:
+                raise DropboxAuthError("访问令牌已失效，且没有配置 refresh token 和 app 凭据")
+            session = await self.session_manager.get_session()
+            start = time.perf_counter()
+            async with session.post(self.token_url, data={
+                'grant_type': 'refresh_token',
+                'refresh_token': self.refresh_token,
+                'client_id': self.app_key,
+                'client_secret': self.app_secret
+            }) as response:
+                if response.status in (400, 401):
+                    raise DropboxAuthError(f"刷新访问令牌失败: {await response.text()}")
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+            metrics.observe('dropbox_token_refresh_seconds', time.perf_counter() - start)
+            metrics.inc('dropbox_token_refreshes')
+            self.access_token = data['access_token']
+            expires_in = data.get('expires_in')
+            self.expires_at = time.monotonic() + expires_in if expires_in else None
+            self.logger.info(f"已刷新访问令牌，{expires_in or '-'} 秒后过期")
+            self.schedule_refresh()
+
+    def schedule_refresh(self):
+        """在过期前 refresh_margin 秒启动后台刷新，调用不必等待刷新请求"""
+        if self._refresh_task is not None and self._refresh_task is not asyncio.current_task():
+            self._refresh_task.cancel()
+        self._refresh_task = None
+        if self.expires_at is None:
+            return
+        delay = max(0, self.expires_at - self.refresh_margin - time.monotonic())
+        self._refresh_task = asyncio.create_task(self._refresh_later(delay))
+
+    async def _refresh_later(self, delay):
+        await asyncio.sleep(delay)
+        try:
+            await self.refresh(stale_token=self.access_token)
+        except Exception as e:
+            # 之后的调用在 get_token 中再次尝试
+            self.logger.error(f"后台刷新访问令牌失败: {str(e)}")
+
+    async def rpc(self, endpoint, args=None):
+        """
+        调用 RPC 端点，如 rpc('files/get_metadata', {'path': ...})
+        :return: 解析后的 JSON 结果
+        """
+        return await self.request(self.api_url, endpoint, args)
+
+    async def upload(self, endpoint, args, data):
+        """调用内容上传端点，如 upload('files/upload_session/start', {'close': False}, data)"""
+        return await self.request(self.content_url, endpoint, args, data)
+
+    async def request(self, base_url, endpoint, args=None, data=None):
+        url = f"{base_url}/2/{endpoint}"
+        for attempt in range(2):
+            token = await self.get_token()
+            headers = {'Authorization': f"Bearer {token}"}
+            if data is None:
+                kwargs = {'json': args}
+            else:
+                # 请求头只能是 ASCII，json.dumps 默认把其他字符转义为 \uXXXX
+                headers['Dropbox-API-Arg'] = json.dumps(args)
+                headers['Content-Type'] = 'application/octet-stream'
+                kwargs = {'data': data}
+            session = await self.session_manager.get_session()
+            async with session.post(url, headers=headers, **kwargs) as response:
+                if response.status == 401:
+                    if attempt == 0 and self.can_refresh:
+                        # 令牌提前失效（被撤销或时钟偏差），刷新后重试一次
+                        await self.refresh(stale_token=token)
+                        continue
+                    raise DropboxAuthError(f"{endpoint}: {await response.text()}")
+                if response.status == 409:
+                    body = await response.json(content_type=None)
+                    raise DropboxApiError(endpoint, body.get('error_summary'), body.get('error'))
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+    async def close(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        await self.session_manager.close()
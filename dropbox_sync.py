@@ -1,12 +1,55 @@
 import os
-import dropbox
-from dropbox.files import WriteMode
-from dropbox.exceptions import ApiError
+import asyncio
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from datetime import datetime
+import time
+from metrics import metrics
+from retry import RetryPolicy, CircuitBreaker, classify_error
+from http_session import SessionManager
+from dropbox_client import DropboxClient, DropboxApiError, DropboxAuthError
+
+# 分块上传的块大小，Dropbox 要求为 4 MiB 的整数倍
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# files/upload_session/finish_batch_v2 单次最多提交的文件数
+FINISH_BATCH_SIZE = 1000
+# Dropbox content_hash 的分块大小
+CONTENT_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+# 熔断器中 Dropbox API 使用的键
+DROPBOX_BREAKER_KEY = 'api.dropboxapi.com'
+
+
+def classify_dropbox_error(error):
+    """
+    判断 Dropbox 调用的错误是否值得重试：429、5xx 和网络错误可以重试（按 Retry-After 等待），
+    业务错误（路径不存在、冲突等）和认证失败不重试
+    """
+    if isinstance(error, (DropboxApiError, DropboxAuthError)):
+        return False, None
+    return classify_error(error)
+
+
+def dropbox_content_hash(path):
+    """按 Dropbox 的 content_hash 算法计算：每 4 MiB 块的 SHA-256 拼接后再取 SHA-256"""
+    block_hashes = b''
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CONTENT_HASH_BLOCK_SIZE), b''):
+            block_hashes += hashlib.sha256(block).digest()
+    return hashlib.sha256(block_hashes).hexdigest()
+
+
+def read_chunk(path, offset, size):
+    """读取文件 offset 处的 size 字节，在线程池中执行"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
 
 class DropboxSync:
-    def __init__(self, access_token, refresh_token=None, app_key=None, app_secret=None, base_path="/coomer_videos"):
+    def __init__(self, access_token=None, refresh_token=None, app_key=None, app_secret=None, base_path="/coomer_videos",
+                 hash_catalog=None, chunk_size=UPLOAD_CHUNK_SIZE, max_concurrent_uploads=2, limiter=None, retry=None,
+                 client=None):
         """
         初始化 Dropbox 同步器
         :param access_token: Dropbox API access token
@@ -14,14 +57,33 @@ class DropboxSync:
         :param app_key: Dropbox app key
         :param app_secret: Dropbox app secret
         :param base_path: Dropbox 中的基础路径
+        :param hash_catalog: 内容哈希目录，已上传过的内容不再重复上传
+        :param chunk_size: 分块上传的块大小
+        :param max_concurrent_uploads: 同时上传的最大文件数
+        :param limiter: 与下载共享的 TokenBucket 限速器
+        :param retry: API 调用使用的 RetryPolicy，默认重试 5 次
+        :param client: DropboxClient，默认用上面的令牌创建，测试时可指向本地替身服务器
         """
-        self.access_token = access_token
-        self.refresh_token = refresh_token
-        self.app_key = app_key
-        self.app_secret = app_secret
         self.base_path = base_path
+        self.hash_catalog = hash_catalog
+        self.chunk_size = chunk_size
+        self.max_concurrent_uploads = max_concurrent_uploads
+        self.limiter = limiter
+        self.retry = retry or RetryPolicy(
+            attempts=5, breaker=CircuitBreaker(), classify=classify_dropbox_error, name='upload'
+        )
+        # 上传和 API 调用都是异步请求，连接在多次调用之间复用
+        self.client = client or DropboxClient(
+            SessionManager(limit_per_host=max_concurrent_uploads + 2),
+            access_token=access_token,
+            refresh_token=refresh_token,
+            app_key=app_key,
+            app_secret=app_secret
+        )
+        # 读取文件块和计算哈希在线程池中执行，避免卡住事件循环
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_uploads + 1, thread_name_prefix='dropbox')
+        self._upload_semaphore = None
         self.setup_logging()
-        self.init_dropbox()
 
     def setup_logging(self):
         """设置日志"""
@@ -33,29 +95,42 @@ class DropboxSync:
             handler.setFormatter(formatter)
             self.logger.addHandler(handler)
 
-    def init_dropbox(self):
-        """初始化或刷新 Dropbox 客户端"""
+    async def connect(self):
+        """
+        获取访问令牌并测试连接，Bot 连上 Discord 后在后台调用，之后令牌在过期前自动刷新
+        :return: 是否连接成功，失败时之后的调用仍会重试
+        """
+        start = time.perf_counter()
         try:
-            self.dbx = dropbox.Dropbox(self.access_token)
-            # 测试连接
-            self.dbx.users_get_current_account()
-        except dropbox.exceptions.AuthError:
-            if self.refresh_token and self.app_key and self.app_secret:
-                self.logger.info("Access token expired, refreshing...")
-                try:
-                    self.dbx = dropbox.Dropbox(
-                        oauth2_refresh_token=self.refresh_token,
-                        app_key=self.app_key,
-                        app_secret=self.app_secret
-                    )
-                    self.access_token = self.dbx._oauth2_access_token
-                    self.logger.info("Successfully refreshed access token")
-                except Exception as e:
-                    self.logger.error(f"Failed to refresh token: {str(e)}")
-                    raise
-            else:
-                self.logger.error("Unable to refresh access token without refresh token and app credentials")
-                raise
+            if self.client.can_refresh and self.client.expires_at is None:
+                # .env 中的访问令牌不知道何时过期，先换一个新的，之后按过期时间提前刷新
+                await self.retry.call(self.client.refresh, self.client.access_token, key=DROPBOX_BREAKER_KEY)
+            await self.call_api('users/get_current_account')
+        except Exception as e:
+            self.logger.error(f"连接 Dropbox 失败: {str(e)}")
+            return False
+        metrics.observe('dropbox_connect_seconds', time.perf_counter() - start)
+        self.logger.info("已连接 Dropbox")
+        return True
+
+    async def close(self):
+        await self.client.close()
+        self.executor.shutdown(wait=False)
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """在线程池中执行阻塞的文件读取和哈希计算"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def call_api(self, endpoint, args=None):
+        """调用 RPC 端点，可重试的错误按 RetryPolicy 退避重试"""
+        return await self.retry.call(self.client.rpc, endpoint, args, key=DROPBOX_BREAKER_KEY)
+
+    def get_upload_semaphore(self):
+        # 在事件循环中创建，避免绑定到其他循环
+        if self._upload_semaphore is None:
+            self._upload_semaphore = asyncio.Semaphore(self.max_concurrent_uploads)
+        return self._upload_semaphore
 
     def get_dropbox_path(self, local_path):
         """
@@ -71,32 +146,50 @@ class DropboxSync:
         :param callback: 进度回调函数
         :return: 是否成功
         """
+        async with self.get_upload_semaphore():
+            return await self._upload_file(local_path, callback)
+
+    async def _upload_file(self, local_path, callback=None):
         try:
             dropbox_path = self.get_dropbox_path(local_path)
             file_size = os.path.getsize(local_path)
+
+            # 检查相同内容是否已上传过
+            catalog_entry = None
+            if self.hash_catalog:
+                catalog_entry = await self.lookup_catalog(local_path)
+                if catalog_entry and catalog_entry['dropbox_path']:
+                    self.logger.info(f"相同内容已上传: {catalog_entry['dropbox_path']}")
+                    if callback:
+                        await callback(local_path, True, "内容已存在")
+                    return True
             
             # 检查文件是否已存在
             try:
-                metadata = self.dbx.files_get_metadata(dropbox_path)
+                metadata = await self.call_api('files/get_metadata', {'path': dropbox_path})
                 self.logger.info(f"文件已存在: {dropbox_path}")
-                if metadata.size == file_size:
+                if metadata.get('size') == file_size:
                     self.logger.info("文件大小相同，跳过上传")
                     if callback:
                         await callback(local_path, True, "已存在")
                     return True
-            except dropbox.exceptions.ApiError as e:
-                if not isinstance(e.error, dropbox.files.GetMetadataError):
+            except DropboxApiError as e:
+                if not e.is_not_found():
                     raise
 
             # 上传文件
             self.logger.info(f"开始上传: {local_path} -> {dropbox_path}")
             
-            with open(local_path, 'rb') as f:
-                self.dbx.files_upload(
-                    f.read(),
-                    dropbox_path,
-                    mode=WriteMode('overwrite')
-                )
+            start = time.perf_counter()
+            await self.upload_chunked(local_path, dropbox_path, file_size)
+            elapsed = time.perf_counter() - start
+            metrics.observe('upload_seconds', elapsed)
+            metrics.inc('upload_bytes', file_size)
+            if elapsed > 0:
+                metrics.observe('upload_bytes_per_second', file_size / elapsed)
+
+            if catalog_entry:
+                await self.hash_catalog.mark_uploaded(catalog_entry, dropbox_path)
 
             if callback:
                 await callback(local_path, True, "上传成功")
@@ -106,52 +199,237 @@ class DropboxSync:
 
         except Exception as e:
             self.logger.error(f"上传失败 {local_path}: {str(e)}")
+            metrics.inc('uploads_failed')
             if callback:
                 await callback(local_path, False, str(e))
             return False
 
+    async def send_chunk(self, local_path, offset, size, endpoint, args):
+        """
+        读取 offset 处的 size 字节并发送到上传端点，按共享限速等待发送所需的时间
+        失败时按 RetryPolicy 只重传这一块，而不是整个文件
+        :return: 端点的返回结果
+        """
+        data = await self.run_blocking(read_chunk, local_path, offset, size)
+
+        async def attempt():
+            if self.limiter:
+                await self.limiter.consume(len(data))
+            return await self.client.upload(endpoint, args, data)
+        return await self.retry.call(attempt, key=DROPBOX_BREAKER_KEY)
+
+    async def upload_chunked(self, local_path, dropbox_path, file_size):
+        """
+        通过上传会话分块上传，内存占用约为一个块大小
+        小于一个块的文件直接上传
+        """
+        commit = {'path': dropbox_path, 'mode': 'overwrite'}
+        if file_size <= self.chunk_size:
+            await self.send_chunk(local_path, 0, file_size, 'files/upload', commit)
+            return
+
+        session = await self.send_chunk(local_path, 0, self.chunk_size, 'files/upload_session/start', {'close': False})
+        cursor = {'session_id': session['session_id'], 'offset': self.chunk_size}
+        while file_size - cursor['offset'] > self.chunk_size:
+            await self.send_chunk(
+                local_path, cursor['offset'], self.chunk_size,
+                'files/upload_session/append_v2', {'cursor': cursor, 'close': False}
+            )
+            cursor['offset'] += self.chunk_size
+        await self.send_chunk(
+            local_path, cursor['offset'], file_size - cursor['offset'],
+            'files/upload_session/finish', {'cursor': cursor, 'commit': commit}
+        )
+
+    async def upload_session(self, local_path, dropbox_path, file_size):
+        """
+        将文件内容上传到一个上传会话并关闭会话
+        :return: 供 files/upload_session/finish_batch_v2 批量提交的条目
+        """
+        size = min(self.chunk_size, file_size)
+        session = await self.send_chunk(
+            local_path, 0, size, 'files/upload_session/start', {'close': size >= file_size}
+        )
+        cursor = {'session_id': session['session_id'], 'offset': size}
+        while cursor['offset'] < file_size:
+            size = min(self.chunk_size, file_size - cursor['offset'])
+            await self.send_chunk(
+                local_path, cursor['offset'], size,
+                'files/upload_session/append_v2', {'cursor': cursor, 'close': cursor['offset'] + size >= file_size}
+            )
+            cursor['offset'] += size
+        return {'cursor': cursor, 'commit': {'path': dropbox_path, 'mode': 'overwrite'}}
+
+    async def lookup_catalog(self, local_path):
+        """
+        查找文件在哈希目录中的记录，未记录的文件先与已有内容比较，没有重复时新增记录
+        :return: 已上传的重复内容或该文件自身的记录
+        """
+        entry = self.hash_catalog.find_by_path(local_path)
+        if entry is not None:
+            return entry
+        fingerprint = await self.hash_catalog.fingerprint(local_path)
+        duplicate = await self.hash_catalog.find_duplicate(local_path, fingerprint)
+        if duplicate and duplicate['dropbox_path']:
+            return duplicate
+        self.hash_catalog.add(local_path, fingerprint)
+        return self.hash_catalog.find_by_path(local_path)
+
+    async def list_remote_files(self):
+        """
+        列出 Dropbox 基础目录下的所有文件
+        :return: {小写文件名: 文件元数据}
+        """
+        remote_files = {}
+        try:
+            result = await self.call_api('files/list_folder', {'path': self.base_path, 'limit': 2000})
+        except DropboxApiError as e:
+            if e.is_not_found():
+                return remote_files
+            raise
+
+        while True:
+            for entry in result['entries']:
+                if entry.get('.tag') == 'file':
+                    remote_files[entry['name'].lower()] = entry
+            if not result['has_more']:
+                return remote_files
+            result = await self.call_api('files/list_folder/continue', {'cursor': result['cursor']})
+
+    async def is_remote_current(self, local_path, remote_files):
+        """远程存在同名文件且大小和 content_hash 都相同时返回 True"""
+        entry = remote_files.get(os.path.basename(local_path).lower())
+        if entry is None or entry['size'] != os.path.getsize(local_path):
+            return False
+        local_hash = await self.run_blocking(dropbox_content_hash, local_path)
+        return local_hash == entry.get('content_hash')
+
     async def sync_directory(self, local_dir, callback=None):
         """
         同步整个目录到 Dropbox
+        先一次性列出远程目录，与本地文件按名称、大小和内容哈希比较，
+        只上传缺失或有变化的文件，并批量提交上传会话
         :param local_dir: 本地目录路径
         :param callback: 进度回调函数
         :return: (成功数, 失败数)
         """
+        local_paths = [
+            os.path.join(root, filename)
+            for root, _, files in os.walk(local_dir)
+            for filename in files
+            if filename.lower().endswith(('.mp4', '.mov', '.avi', '.wmv', '.flv'))
+        ]
+        if not local_paths:
+            return 0, 0
+
+        try:
+            remote_files = await self.list_remote_files()
+        except Exception as e:
+            self.logger.error(f"列出 Dropbox 目录失败: {str(e)}")
+            for local_path in local_paths:
+                if callback:
+                    await callback(local_path, False, str(e))
+            return 0, len(local_paths)
+
         success_count = 0
-        failed_count = 0
+        pending = []
+        for local_path in local_paths:
+            catalog_entry = None
+            if self.hash_catalog:
+                catalog_entry = await self.lookup_catalog(local_path)
+                if catalog_entry and catalog_entry['dropbox_path']:
+                    success_count += 1
+                    if callback:
+                        await callback(local_path, True, "内容已存在")
+                    continue
+            if await self.is_remote_current(local_path, remote_files):
+                success_count += 1
+                if callback:
+                    await callback(local_path, True, "已存在")
+                continue
+            pending.append((local_path, catalog_entry))
+
+        self.logger.info(f"需要上传 {len(pending)}/{len(local_paths)} 个文件")
+        for i in range(0, len(pending), FINISH_BATCH_SIZE):
+            success_count += await self.upload_batch(pending[i:i + FINISH_BATCH_SIZE], callback)
+
+        return success_count, len(local_paths) - success_count
+
+    async def upload_batch(self, items, callback=None):
+        """
+        并发上传一批文件的内容，再通过一次 files_upload_session_finish_batch_v2 提交
+        :param items: [(本地路径, 哈希目录记录)]
+        :return: 成功数
+        """
+        async def start_session(local_path):
+            async with self.get_upload_semaphore():
+                return await self.upload_session(
+                    local_path, self.get_dropbox_path(local_path), os.path.getsize(local_path)
+                )
 
-        for root, _, files in os.walk(local_dir):
-            for filename in files:
-                if filename.lower().endswith(('.mp4', '.mov', '.avi', '.wmv', '.flv')):
-                    local_path = os.path.join(root, filename)
-                    if await self.upload_file(local_path, callback):
-                        success_count += 1
-                    else:
-                        failed_count += 1
+        sessions = await asyncio.gather(*(start_session(path) for path, _ in items), return_exceptions=True)
 
-        return success_count, failed_count
+        committed = []
+        for (local_path, catalog_entry), session in zip(items, sessions):
+            if isinstance(session, Exception):
+                self.logger.error(f"上传失败 {local_path}: {str(session)}")
+                if callback:
+                    await callback(local_path, False, str(session))
+            else:
+                committed.append((local_path, catalog_entry, session))
+        if not committed:
+            return 0
+
+        try:
+            result = await self.call_api(
+                'files/upload_session/finish_batch_v2', {'entries': [session for _, _, session in committed]}
+            )
+        except Exception as e:
+            self.logger.error(f"批量提交失败: {str(e)}")
+            for local_path, _, _ in committed:
+                if callback:
+                    await callback(local_path, False, str(e))
+            return 0
+
+        success_count = 0
+        for (local_path, catalog_entry, session), entry in zip(committed, result['entries']):
+            if entry.get('.tag') == 'success':
+                success_count += 1
+                if catalog_entry:
+                    await self.hash_catalog.mark_uploaded(catalog_entry, session['commit']['path'])
+                if callback:
+                    await callback(local_path, True, "上传成功")
+            else:
+                self.logger.error(f"提交失败 {local_path}: {entry.get('failure')}")
+                if callback:
+                    await callback(local_path, False, str(entry.get('failure')))
+        self.logger.info(f"批量提交完成: {success_count}/{len(committed)}")
+        return success_count
 
-    def create_share_link(self, dropbox_path):
+    async def create_share_link(self, dropbox_path):
         """
         创建文件的分享链接
         :param dropbox_path: Dropbox 中的文件路径
         :return: 分享链接
         """
         try:
-            shared_link_metadata = self.dbx.sharing_create_shared_link_with_settings(dropbox_path)
-            return shared_link_metadata.url
+            shared_link_metadata = await self.call_api(
+                'sharing/create_shared_link_with_settings', {'path': dropbox_path}
+            )
+            return shared_link_metadata['url']
         except Exception as e:
             self.logger.error(f"创建分享链接失败: {str(e)}")
             return None
 
-    def get_storage_usage(self):
+    async def get_storage_usage(self):
         """
         获取存储使用情况
         :return: (已用空间, 总空间) 单位为字节
         """
         try:
-            space_usage = self.dbx.users_get_space_usage()
-            return space_usage.used, space_usage.allocation.get_individual().allocated
+            space_usage = await self.call_api('users/get_space_usage')
+            # 个人账户和团队账户的 allocation 都有 allocated 字段
+            return space_usage['used'], space_usage['allocation']['allocated']
         except Exception as e:
             self.logger.error(f"获取存储使用情况失败: {str(e)}")
             return None, None
@@ -0,0 +1,161 @@
+import asyncio
+from urllib.parse import urlparse
+import aiohttp
+from retry import RetryPolicy, CircuitOpenError, classify_error
+
+# 条件请求命中（HTTP 304）时返回的标记
+NOT_MODIFIED = object()
+
+
+def classify_browser_error(error):
+    """浏览器加载失败（超时、崩溃等）都可以重试"""
+    # 浏览器出错时 selenium 已经导入
+    from selenium.common.exceptions import WebDriverException
+    if isinstance(error, WebDriverException):
+        return True, None
+    return classify_error(error)
+
+
+class HttpFetcher:
+    """基于 aiohttp 的页面抓取器，适用于不需要执行 JavaScript 的页面"""
+
+    def __init__(self, session_manager, per_host_limit=4, timeout=30, retry=None):
+        """
+        :param session_manager: 共享的 SessionManager
+        :param per_host_limit: 每个主机的最大并发请求数
+        :param timeout: 单个请求的超时时间（秒）
+        :param retry: RetryPolicy，默认重试 3 次
+        """
+        self.session_manager = session_manager
+        self.per_host_limit = per_host_limit
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retry = retry or RetryPolicy(attempts=3, name='page_fetch')
+        self._host_semaphores = {}
+
+    def host_semaphore(self, url):
+        """获取 URL 所属主机的并发信号量"""
+        host = urlparse(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host_limit)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def fetch(self, url, expect=None):
+        """
+        获取页面 HTML
+        :param url: 页面地址
+        :param expect: 页面中必须包含的标记，缺失时视为需要浏览器渲染
+        :return: HTML 文本，失败时返回 None
+        """
+        html, _ = await self.fetch_conditional(url, expect)
+        return html
+
+    async def fetch_conditional(self, url, expect=None, validators=None):
+        """
+        带 If-None-Match / If-Modified-Since 请求头获取页面
+        :param validators: 上次响应的 {'etag', 'last_modified'}
+        :return: (HTML, 本次响应的 {'etag', 'last_modified'})，页面未变化时 HTML 为 NOT_MODIFIED，失败时为 None
+        """
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        try:
+            html, new_validators = await self.retry.call(self.request, url, headers, key=urlparse(url).netloc)
+        except CircuitOpenError as e:
+            print(f"跳过 {url}: {e}")
+            return None, None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"HTTP 请求失败 {url}: {e}")
+            return None, None
+
+        if html is NOT_MODIFIED:
+            return NOT_MODIFIED, validators
+        if expect and expect not in html:
+            print(f"页面缺少 {expect}，可能需要浏览器渲染: {url}")
+            return None, None
+        return html, new_validators
+
+    async def request(self, url, headers):
+        """
+        发送一次 GET 请求，错误状态码抛出 ClientResponseError，由 RetryPolicy 判断是否重试
+        :return: (HTML 或 NOT_MODIFIED, 本次响应的 {'etag', 'last_modified'})
+        """
+        session = await self.session_manager.get_session()
+        async with self.host_semaphore(url):
+            async with session.get(url, headers=headers, timeout=self.timeout) as response:
+                if response.status == 304:
+                    return NOT_MODIFIED, None
+                response.raise_for_status()
+                html = await response.text()
+                return html, {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }
+
+    async def close(self):
+        # 会话由 SessionManager 统一关闭
+        pass
+
+
+class SeleniumFetcher:
+    """通过 DriverPool 中的 WebDriver 抓取页面，多个页面可在不同实例上并行加载"""
+
+    def __init__(self, driver_pool, load_page, retry=None):
+        """
+        :param driver_pool: DriverPool 实例
+        :param load_page: 加载页面的阻塞函数 load_page(driver, url)，返回 HTML
+        :param retry: RetryPolicy，默认重试 3 次，第一次重试前最多等待 5 秒
+        """
+        self.driver_pool = driver_pool
+        self.load_page = load_page
+        self.retry = retry or RetryPolicy(attempts=3, base_delay=5, classify=classify_browser_error, name='page_fetch')
+
+    async def fetch(self, url, expect=None):
+        print(f"Fetching content from {url}...")
+        try:
+            return await self.retry.call(self.driver_pool.fetch, self.load_page, url, key=urlparse(url).netloc)
+        except CircuitOpenError as e:
+            print(f"跳过 {url}: {e}")
+            return None
+        except Exception as e:
+            print(f"Failed to fetch page {url}: {e}")
+            return None
+
+    async def fetch_conditional(self, url, expect=None, validators=None):
+        # 浏览器无法发送条件请求
+        return await self.fetch(url, expect), None
+
+    async def close(self):
+        # 实例在多次运行之间保留，由 DriverPool.close 关闭
+        pass
+
+
+class FallbackFetcher:
+    """优先使用 primary 抓取，失败时回退到 fallback"""
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    async def fetch(self, url, expect=None):
+        html = await self.primary.fetch(url, expect)
+        if html is None:
+            print(f"回退到浏览器抓取: {url}")
+            html = await self.fallback.fetch(url, expect)
+        return html
+
+    async def fetch_conditional(self, url, expect=None, validators=None):
+        html, new_validators = await self.primary.fetch_conditional(url, expect, validators)
+        if html is None:
+            print(f"回退到浏览器抓取: {url}")
+            html, new_validators = await self.fallback.fetch_conditional(url, expect, validators)
+        return html, new_validators
+
+    async def close(self):
+        await self.primary.close()
+        await self.fallback.close()
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+def url_hash(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+class HistoryStore:
+    """
+    基于 SQLite（WAL 模式）的爬取历史，按 post_id、文件名和 URL 哈希建立索引
+    新帖子先在内存中累积，flush 时在一个事务中写入，两次写入之间不占用数据库的写锁
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS posts (
+            post_id TEXT PRIMARY KEY,
+            service TEXT,
+            user_id TEXT,
+            url TEXT,
+            timestamp TEXT,
+            favorites TEXT,
+            attachments TEXT,
+            scraped_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS videos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            post_id TEXT NOT NULL,
+            url TEXT,
+            url_hash TEXT,
+            filename TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_videos_post_id ON videos(post_id);
+        CREATE INDEX IF NOT EXISTS idx_videos_filename ON videos(filename);
+        CREATE INDEX IF NOT EXISTS idx_videos_url_hash ON videos(url_hash);
+        CREATE TABLE IF NOT EXISTS crawl_state (
+            url TEXT PRIMARY KEY,
+            newest_post_id TEXT,
+            newest_timestamp TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            updated_at REAL
+        );
+    """
+
+    def __init__(self, db_path, batch_size=50):
+        """
+        :param db_path: 数据库文件路径
+        :param batch_size: 累计多少个帖子后提交一次事务
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        # 未写入的帖子 {post_id: post_data}
+        self.pending = {}
+        self.conn = self.connect()
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+
+    def connect(self):
+        """
+        打开同一数据库的新连接
+        任务队列和下载目录状态的写入各自立即提交，使用独立的连接，不会顺带提交累积中的历史记录
+        """
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    def migrate_from_json(self, json_path):
+        """
+        一次性导入旧的 scraped_posts.json，导入后将其重命名为 .migrated
+        :return: 导入的帖子数
+        """
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                scraped_posts = json.load(f)
+        except Exception as e:
+            print(f"读取旧历史记录时出错: {e}")
+            return 0
+
+        with self.conn:
+            for post_id, post_data in scraped_posts.items():
+                self._insert_post(post_id, post_data)
+        os.replace(json_path, json_path + '.migrated')
+        print(f"已从 {os.path.basename(json_path)} 迁移 {len(scraped_posts)} 条历史记录")
+        return len(scraped_posts)
+
+    def add_post(self, post_id, post_data):
+        self.pending[post_id] = post_data
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def get_post(self, post_id):
+        if post_id in self.pending:
+            return dict(self.pending[post_id], post_id=post_id)
+        row = self.conn.execute(
+            'SELECT post_id, service, user_id, url, timestamp, favorites, attachments FROM posts WHERE post_id = ?',
+            (post_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ('post_id', 'service', 'user_id', 'url', 'timestamp', 'favorites', 'attachments')
+        post_data = dict(zip(keys, row))
+        post_data['videos'] = [
+            {'url': url, 'filename': filename}
+            for url, filename in self.conn.execute(
+                'SELECT url, filename FROM videos WHERE post_id = ? ORDER BY id', (post_id,)
+            )
+        ]
+        return post_data
+
+    def iter_posts(self):
+        """遍历所有帖子 ID"""
+        for (post_id,) in self.conn.execute('SELECT post_id FROM posts'):
+            yield post_id
+
+    def iter_videos(self):
+        """遍历所有视频记录，产出 (post_id, url, filename)"""
+        yield from self.conn.execute('SELECT post_id, url, filename FROM videos')
+
+    def count_posts(self):
+        return self.conn.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+
+    def get_crawl_state(self, url):
+        """
+        获取列表页 URL 的抓取状态
+        :return: {'newest_post_id', 'newest_timestamp', 'etag', 'last_modified'}，未抓取过时返回 None
+        """
+        row = self.conn.execute(
+            'SELECT newest_post_id, newest_timestamp, etag, last_modified FROM crawl_state WHERE url = ?',
+            (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('newest_post_id', 'newest_timestamp', 'etag', 'last_modified'), row))
+
+    def set_crawl_state(self, url, state):
+        """保存列表页 URL 的抓取状态，与累积的帖子一起立即提交"""
+        self.write_pending()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO crawl_state '
+            '(url, newest_post_id, newest_timestamp, etag, last_modified, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                url,
+                state.get('newest_post_id'),
+                state.get('newest_timestamp'),
+                state.get('etag'),
+                state.get('last_modified'),
+                time.time()
+            )
+        )
+        self.conn.commit()
+
+    def flush(self):
+        self.write_pending()
+        self.conn.commit()
+
+    def write_pending(self):
+        for post_id, post_data in self.pending.items():
+            self._insert_post(post_id, post_data)
+        self.pending.clear()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def _insert_post(self, post_id, post_data):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO posts '
+            '(post_id, service, user_id, url, timestamp, favorites, attachments, scraped_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                post_id,
+                post_data.get('service'),
+                post_data.get('user_id'),
+                post_data.get('url'),
+                post_data.get('timestamp'),
+                post_data.get('favorites'),
+                post_data.get('attachments'),
+                time.time()
+            )
+        )
+        self.conn.execute('DELETE FROM videos WHERE post_id = ?', (post_id,))
+        self.conn.executemany(
+            'INSERT INTO videos (post_id, url, url_hash, filename) VALUES (?, ?, ?, ?)',
+            [
+                (post_id, video.get('url'), url_hash(video['url']) if video.get('url') else None, video.get('filename'))
+                for video in post_data.get('videos', [])
+            ]
+        )
@@ -0,0 +1,51 @@
+import aiohttp
+
+
+class SessionManager:
+    """爬虫生命周期内共享的 aiohttp 会话，复用 TCP/TLS 连接和 DNS 缓存"""
+
+    def __init__(self, headers=None, limit=100, limit_per_host=8, dns_ttl=300,
+                 keepalive_timeout=60, connect_timeout=30, read_timeout=60):
+        """
+        :param headers: 默认请求头
+        :param limit: 连接池的最大连接数
+        :param limit_per_host: 每个主机的最大连接数
+        :param dns_ttl: DNS 缓存时间（秒）
+        :param keepalive_timeout: 空闲连接保持时间（秒）
+        :param connect_timeout: 建立连接的超时时间（秒）
+        :param read_timeout: 两次读取之间的超时时间（秒），大文件下载不设总超时
+        """
+        self.headers = headers or {}
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout
+        )
+        self._session = None
+
+    def create_connector(self):
+        return aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=self.keepalive_timeout
+        )
+
+    async def get_session(self):
+        """获取共享会话，不存在或已关闭时重新创建"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=self.create_connector(),
+                headers=self.headers,
+                timeout=self.timeout
+            )
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
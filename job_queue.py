@@ -0,0 +1,117 @@
+import time
+
+# 任务状态
+DISCOVERED = 'discovered'
+DOWNLOADING = 'downloading'
+DOWNLOADED = 'downloaded'
+UPLOADING = 'uploading'
+SYNCED = 'synced'
+FAILED = 'failed'
+
+STATES = (DISCOVERED, DOWNLOADING, DOWNLOADED, UPLOADING, SYNCED, FAILED)
+
+
+class JobQueue:
+    """
+    持久化的视频任务队列，每个视频一条记录，状态依次为
+    discovered → downloading → downloaded → uploading → synced，出错时为 failed
+
+    与爬取历史使用同一个 SQLite 连接：帖子记录和它的视频任务在同一个事务中提交，
+    不会出现帖子已标记为处理过、视频任务却丢失的情况。状态变化立即提交，
+    进程重启后未完成的任务由 pending 取回继续处理。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL UNIQUE,
+            filename TEXT NOT NULL,
+            post_id TEXT,
+            source TEXT,
+            state TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            upload_attempts INTEGER NOT NULL DEFAULT 0,
+            detail TEXT,
+            created_at REAL,
+            updated_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_source_state ON jobs(source, state);
+    """
+
+    def __init__(self, conn, max_attempts=3):
+        """
+        :param conn: 爬取历史数据库的 sqlite3 连接（HistoryStore.connect()），不与 HistoryStore 共用
+        :param max_attempts: 失败的任务最多下载和上传的次数（分别计数），任一超过后不再自动重试
+        """
+        self.conn = conn
+        self.max_attempts = max_attempts
+        self.conn.executescript(self.SCHEMA)
+        self.recover()
+
+    def recover(self):
+        """
+        启动时调用：上次进程退出时正在下载或上传的任务退回到上一个状态
+        下载中断的文件由 SegmentedDownloader 从 .part 断点继续
+        """
+        now = time.time()
+        with self.conn:
+            downloading = self.conn.execute(
+                'UPDATE jobs SET state = ?, updated_at = ? WHERE state = ?', (DISCOVERED, now, DOWNLOADING)
+            ).rowcount
+            uploading = self.conn.execute(
+                'UPDATE jobs SET state = ?, updated_at = ? WHERE state = ?', (DOWNLOADED, now, UPLOADING)
+            ).rowcount
+        if downloading or uploading:
+            print(f"恢复未完成的任务: 下载 {downloading} 个，上传 {uploading} 个")
+
+    def add_videos(self, post_id, videos, source=None):
+        """
+        登记帖子中的视频并提交
+        已登记过的视频（相同 URL）保持原状态
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO jobs (url, filename, post_id, source, state, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(video['url'], video['filename'], post_id, source, DISCOVERED, now, now) for video in videos]
+            )
+
+    def set_state(self, url, state, detail=None):
+        """更新任务状态并立即提交，开始下载和开始上传时分别累加尝试次数"""
+        with self.conn:
+            self.conn.execute(
+                'UPDATE jobs SET state = ?, detail = ?, updated_at = ?, '
+                'attempts = attempts + (CASE WHEN ? = ? THEN 1 ELSE 0 END), '
+                'upload_attempts = upload_attempts + (CASE WHEN ? = ? THEN 1 ELSE 0 END) WHERE url = ?',
+                (state, detail, time.time(), state, DOWNLOADING, state, UPLOADING, url)
+            )
+
+    def get(self, url):
+        row = self.conn.execute(
+            'SELECT url, filename, post_id, source, state, attempts, upload_attempts, detail FROM jobs WHERE url = ?',
+            (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('url', 'filename', 'post_id', 'source', 'state', 'attempts', 'upload_attempts', 'detail'), row))
+
+    def pending(self, source, uploads=True):
+        """
+        取出来源下需要继续处理的任务，按登记顺序排列
+        :param uploads: 是否包括已下载未上传的任务，不上传 Dropbox 时 downloaded 即为完成
+        :return: [{'url', 'filename', 'state'}]，包括未完成的任务和可重试的失败任务
+        """
+        states = (DISCOVERED, DOWNLOADING, DOWNLOADED, UPLOADING) if uploads else (DISCOVERED, DOWNLOADING)
+        rows = self.conn.execute(
+            f"SELECT url, filename, state FROM jobs WHERE source = ? AND "
+            f"(state IN ({', '.join('?' * len(states))}) OR "
+            f"(state = ? AND attempts < ? AND upload_attempts < ?)) ORDER BY id",
+            (source, *states, FAILED, self.max_attempts, self.max_attempts)
+        )
+        return [{'url': url, 'filename': filename, 'state': state} for url, filename, state in rows]
+
+    def count_by_state(self):
+        """:return: {状态: 任务数}"""
+        counts = dict(self.conn.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state'))
+        return {state: counts.get(state, 0) for state in STATES}
@@ -0,0 +1,130 @@
+import json
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    轻量的运行指标记录
+
+    observe 记录样本（耗时、吞吐量、队列长度等），保留最近 max_samples 个用于计算分位数；
+    inc 累加计数器；set_gauge 记录当前值。start_run 在每次运行开始时清空，
+    因此汇总结果对应最近一次运行。
+    """
+
+    def __init__(self, max_samples=2048):
+        self.max_samples = max_samples
+        self.reset()
+
+    def reset(self):
+        self.samples = {}
+        self.sums = {}
+        self.counts = {}
+        self.counters = {}
+        self.gauges = {}
+        self.run_started = time.time()
+
+    def start_run(self):
+        self.reset()
+
+    def observe(self, name, value):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.max_samples)
+        samples.append(value)
+        self.sums[name] = self.sums.get(name, 0) + value
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def inc(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    @contextmanager
+    def timer(self, name):
+        """记录代码块耗时（秒），在协程中同样适用"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def percentile(self, name, q):
+        samples = sorted(self.samples.get(name, ()))
+        if not samples:
+            return None
+        index = max(0, math.ceil(q * len(samples)) - 1)
+        return samples[index]
+
+    def summary(self):
+        """
+        :return: {'samples': {名称: {count, sum, p50, p95, max}}, 'counters': {...}, 'gauges': {...}}
+        """
+        samples = {}
+        for name, values in self.samples.items():
+            samples[name] = {
+                'count': self.counts[name],
+                'sum': self.sums[name],
+                'p50': self.percentile(name, 0.5),
+                'p95': self.percentile(name, 0.95),
+                'max': max(values)
+            }
+        return {
+            'run_started': self.run_started,
+            'samples': samples,
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges)
+        }
+
+    def to_json(self):
+        return json.dumps(self.summary(), ensure_ascii=False)
+
+    def to_prometheus(self, prefix='coomer'):
+        """Prometheus 文本格式，样本按 summary 类型输出"""
+        summary = self.summary()
+        lines = []
+        for name, stats in sorted(summary['samples'].items()):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} summary")
+            lines.append(f'{metric}{{quantile="0.5"}} {stats["p50"]}')
+            lines.append(f'{metric}{{quantile="0.95"}} {stats["p95"]}')
+            lines.append(f"{metric}_sum {stats['sum']}")
+            lines.append(f"{metric}_count {stats['count']}")
+        for name, value in sorted(summary['counters'].items()):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for name, value in sorted(summary['gauges'].items()):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+async def start_exporter(registry, host='127.0.0.1', port=9108):
+    """
+    在本地端口提供 /metrics（Prometheus 文本）和 /metrics.json
+    :return: aiohttp AppRunner，停止时调用 cleanup()
+    """
+    from aiohttp import web
+
+    async def prometheus(request):
+        return web.Response(text=registry.to_prometheus(), content_type='text/plain')
+
+    async def as_json(request):
+        return web.Response(text=registry.to_json(), content_type='application/json')
+
+    app = web.Application()
+    app.router.add_get('/metrics', prometheus)
+    app.router.add_get('/metrics.json', as_json)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+# 全局指标记录器
+metrics = Metrics()
@@ -0,0 +1,132 @@
+import functools
+import hashlib
+import os
+from dataclasses import dataclass, asdict
+from urllib.parse import urlparse
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.wmv', '.flv')
+
+
+def video_filename(href, display_name=None):
+    """
+    本地保存的文件名
+    数据节点的路径按内容寻址，直接使用路径中的文件名；使用附件的显示名称（download 属性）时，
+    不同帖子中常有同名附件（如 1.mp4），追加由 URL 路径计算的短哈希，避免在下载目录中互相覆盖。
+    显示名称由上传者决定，去掉其中的目录部分，不能写到下载目录之外
+    """
+    path = urlparse(href).path
+    basename = os.path.basename(path)
+    if display_name:
+        display_name = os.path.basename(display_name.replace('\\', '/')).strip()
+    if not display_name or display_name in ('.', '..') or display_name == basename:
+        return basename
+    stem, ext = os.path.splitext(display_name)
+    return f"{stem}_{hashlib.sha1(path.encode('utf-8')).hexdigest()[:10]}{ext}"
+
+
+def has_class(*names):
+    """
+    SoupStrainer 的 class 匹配函数
+    建树时 class 属性还是未拆分的字符串，直接传列表无法匹配多个 class 的标签
+    """
+    names = set(names)
+
+    def match(value):
+        if not value:
+            return False
+        values = value.split() if isinstance(value, str) else value
+        return any(v in names for v in values)
+    return match
+
+
+@functools.lru_cache(maxsize=None)
+def strainer(name, *classes):
+    """
+    只解析需要的节点，其余标签在建树时直接丢弃
+    bs4 导入较慢，第一次解析页面时才导入
+    """
+    from bs4 import SoupStrainer
+    return SoupStrainer(name, class_=has_class(*classes))
+
+
+def make_soup(html, name, *classes):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, HTML_PARSER, parse_only=strainer(name, *classes))
+
+
+@dataclass
+class PostCard:
+    """列表页中的一个帖子卡片"""
+    post_id: str = None
+    service: str = None
+    user_id: str = None
+    url: str = None
+    timestamp: str = None
+    favorites: str = None
+    attachments: str = None
+
+    def to_dict(self):
+        return asdict(self)
+
+
+@dataclass
+class VideoLink:
+    """帖子页中的一个视频附件"""
+    url: str
+    filename: str
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def parse_post_cards(html):
+    """解析列表页，返回 PostCard 列表"""
+    soup = make_soup(html, 'article', 'post-card', 'post-card--preview')
+    return [_parse_post_card(article) for article in soup.find_all('article')]
+
+
+def _parse_post_card(article):
+    card = PostCard(
+        post_id=article.get('data-id'),
+        service=article.get('data-service'),
+        user_id=article.get('data-user'),
+    )
+
+    link = article.find('a', class_='fancy-link')
+    if link is not None:
+        card.url = link.get('href')
+
+    timestamp = article.find('time', class_='timestamp')
+    if timestamp is not None:
+        card.timestamp = timestamp.get('datetime')
+
+    footer = article.find('footer')
+    if footer is not None:
+        for line in footer.get_text(separator='\n').splitlines():
+            line = line.strip()
+            lowered = line.lower()
+            if 'attachments' in lowered:
+                card.attachments = line.split(' ')[0]
+            elif 'favorites' in lowered:
+                card.favorites = line.split(' ')[0]
+    return card
+
+
+def parse_video_links(html):
+    """解析帖子页，返回视频附件的 VideoLink 列表"""
+    soup = make_soup(html, 'a', 'post__attachment-link')
+    video_links = []
+    for link in soup.find_all('a'):
+        href = link.get('href')
+        if href and any(ext in href.lower() for ext in VIDEO_EXTENSIONS):
+            video_links.append(VideoLink(
+                url=href,
+                filename=video_filename(href, link.get('download'))
+            ))
+    return video_links
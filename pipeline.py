@@ -0,0 +1,166 @@
+import asyncio
+import os
+from metrics import metrics
+from job_queue import DOWNLOADED
+
+
+class ScrapePipeline:
+    """发现帖子 → 下载视频 → 上传 Dropbox 的流式流水线，各阶段之间使用有界队列实现背压"""
+
+    def __init__(self, scraper, dropbox_sync=None, callback=None,
+                 download_concurrency=3, upload_concurrency=2,
+                 video_queue_size=20, upload_queue_size=10, backfill=False, max_pages=None,
+                 download_slots=None, priority=0):
+        """
+        :param scraper: CoomerScraper 实例
+        :param dropbox_sync: DropboxSync 实例，为 None 时不上传
+        :param callback: 进度回调（DiscordScraperCallback）
+        :param download_concurrency: 下载阶段的并发数
+        :param upload_concurrency: 上传阶段的并发数
+        :param video_queue_size: 待下载队列的最大长度
+        :param upload_queue_size: 待上传队列的最大长度
+        :param backfill: 是否忽略已知帖子继续向后翻页
+        :param max_pages: 每个 URL 最多抓取的列表页数，默认使用 scraper 的设置
+        :param download_slots: 多个流水线共享的 PrioritySemaphore，限制全局同时下载数
+        :param priority: 争用 download_slots 时的优先级，数值大的先获得
+        """
+        self.scraper = scraper
+        self.dropbox_sync = dropbox_sync
+        self.callback = callback
+        self.download_concurrency = download_concurrency
+        self.upload_concurrency = upload_concurrency
+        self.video_queue_size = video_queue_size
+        self.upload_queue_size = upload_queue_size
+        self.backfill = backfill
+        self.max_pages = max_pages
+        self.download_slots = download_slots
+        self.priority = priority
+        self.stats = {
+            'posts': 0,
+            'videos': 0,
+            'downloaded': 0,
+            'uploaded': 0,
+            'failed': 0,
+            'resumed': 0
+        }
+
+    async def run(self, urls):
+        """
+        依次发现各个 URL 下的帖子，下载和上传与发现同时进行
+        :param urls: 列表页 URL 列表
+        :return: 统计信息
+        """
+        video_queue = asyncio.Queue(self.video_queue_size)
+        upload_queue = asyncio.Queue(self.upload_queue_size)
+        # 不上传时下载的文件不会变为可删除，下载目录不按配额限制
+        self.scraper.staging.uploads = self.dropbox_sync is not None
+
+        workers = [
+            asyncio.create_task(self.download_worker(video_queue, upload_queue))
+            for _ in range(self.download_concurrency)
+        ]
+        if self.dropbox_sync:
+            workers.extend(
+                asyncio.create_task(self.upload_worker(upload_queue))
+                for _ in range(self.upload_concurrency)
+            )
+
+        run_log = self.scraper.run_log
+        run_ids = []
+        error = None
+        try:
+            for url in urls:
+                run_id = run_log.start_run(url)
+                run_ids.append(run_id)
+                await self.resume(url, video_queue, upload_queue)
+                await self.discover(url, video_queue, run_id)
+            await video_queue.join()
+            await upload_queue.join()
+        except BaseException as e:
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # 下载和上传在所有 URL 之间共享，各次运行记录同一份统计
+            for run_id in run_ids:
+                run_log.finish_run(run_id, stats=dict(self.stats), error=error)
+
+        print(f"\n流水线完成! 帖子: {self.stats['posts']}，视频: {self.stats['videos']}（其中恢复 {self.stats['resumed']}），"
+              f"下载: {self.stats['downloaded']}，上传: {self.stats['uploaded']}，失败: {self.stats['failed']}")
+        return self.stats
+
+    async def resume(self, url, video_queue, upload_queue):
+        """把任务队列中该来源未完成的视频重新放入下载或上传队列"""
+        resumed = 0
+        for job in self.scraper.jobs.pending(url, uploads=self.dropbox_sync is not None):
+            video = {'url': job['url'], 'filename': job['filename']}
+            resumed += 1
+            file_path = os.path.join(self.scraper.download_dir, job['filename'])
+            # 下载完成的文件才会重命名为最终文件名，存在即说明只差上传
+            if os.path.exists(file_path):
+                if job['state'] != DOWNLOADED:
+                    self.scraper.jobs.set_state(job['url'], DOWNLOADED)
+                if self.dropbox_sync:
+                    await upload_queue.put(video)
+                continue
+            await video_queue.put(video)
+        if resumed:
+            print(f"从任务队列恢复 {resumed} 个视频")
+            self.stats['videos'] += resumed
+            self.stats['resumed'] += resumed
+
+    async def discover(self, url, video_queue, run_id):
+        """发现阶段：解析帖子并把视频放入下载队列，队列满时暂停解析"""
+        async for post_data in self.scraper.iter_posts(url, self.callback, self.backfill, self.max_pages):
+            self.stats['posts'] += 1
+            self.scraper.run_log.record_post(run_id, post_data)
+            for video in post_data['videos']:
+                self.stats['videos'] += 1
+                await video_queue.put(video)
+                metrics.observe('video_queue_depth', video_queue.qsize())
+
+    async def download_worker(self, video_queue, upload_queue):
+        """下载阶段：下载完成的文件放入上传队列"""
+        while True:
+            video = await video_queue.get()
+            try:
+                success = await self.download(video)
+                if not success:
+                    self.stats['failed'] += 1
+                    continue
+                self.stats['downloaded'] += 1
+                file_path = os.path.join(self.scraper.download_dir, video['filename'])
+                # 内容重复的文件下载后已被删除，无需上传
+                if self.dropbox_sync and os.path.exists(file_path):
+                    await upload_queue.put(video)
+                    metrics.observe('upload_queue_depth', upload_queue.qsize())
+            except Exception as e:
+                self.stats['failed'] += 1
+                print(f"下载阶段出错: {e}")
+            finally:
+                video_queue.task_done()
+
+    async def download(self, video):
+        # 先等空间再占名额，下载目录已满时不占着全局名额等待
+        await self.scraper.staging.wait_for_space()
+        if self.download_slots is None:
+            return await self.scraper.download_video(video['url'], video['filename'], self.callback)
+        async with self.download_slots.hold(self.priority):
+            return await self.scraper.download_video(video['url'], video['filename'], self.callback)
+
+    async def upload_worker(self, upload_queue):
+        """上传阶段：上传成功后本地文件由 StagingArea 按空间需要删除"""
+        while True:
+            video = await upload_queue.get()
+            try:
+                if await self.scraper.sync_video(video, self.dropbox_sync, self.callback):
+                    self.stats['uploaded'] += 1
+                else:
+                    self.stats['failed'] += 1
+            except Exception as e:
+                self.stats['failed'] += 1
+                print(f"上传阶段出错: {e}")
+            finally:
+                upload_queue.task_done()
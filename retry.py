@@ -0,0 +1,211 @@
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import aiohttp
+from dropbox_client import DropboxApiError
+from metrics import metrics
+
+# 可以重试的 HTTP 状态码
+RETRYABLE_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+# 服务器返回了响应的错误，不可重试时说明主机可用
+RESPONSE_ERRORS = (aiohttp.ClientResponseError, DropboxApiError)
+
+
+class CircuitOpenError(Exception):
+    """目标的熔断器处于打开状态，请求未发出"""
+
+    def __init__(self, key, retry_in):
+        super().__init__(f"{key} 暂停请求，{retry_in:.0f} 秒后重试")
+        self.key = key
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value):
+    """
+    解析 Retry-After 响应头，支持秒数和 HTTP 日期两种格式
+    :return: 需要等待的秒数，无法解析时返回 None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def classify_error(error):
+    """
+    判断网络错误是否值得重试
+    :return: (是否可重试, 服务器要求的等待秒数或 None)
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        retry_after = parse_retry_after(error.headers.get('Retry-After')) if error.headers else None
+        return error.status in RETRYABLE_STATUSES, retry_after
+    if isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                          asyncio.TimeoutError, ConnectionError, TimeoutError)):
+        return True, None
+    return False, None
+
+
+class CircuitBreaker:
+    """
+    按主机（或其他键）统计连续失败的熔断器
+
+    连续 failure_threshold 次可重试的失败后打开，reset_timeout 秒内的请求直接失败；
+    之后放行一个试探请求（半开），成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        """
+        :param failure_threshold: 打开熔断器所需的连续失败次数
+        :param reset_timeout: 打开后多少秒放行试探请求
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = {}
+        self.opened_at = {}
+        self.probing = set()
+
+    def check(self, key):
+        """
+        请求前调用，熔断器打开时抛出 CircuitOpenError
+        :return: 本次请求是否为半开状态的试探请求
+        """
+        opened_at = self.opened_at.get(key)
+        if opened_at is None:
+            return False
+        remaining = opened_at + self.reset_timeout - time.monotonic()
+        if remaining > 0 or key in self.probing:
+            raise CircuitOpenError(key, max(remaining, 0))
+        self.probing.add(key)
+        return True
+
+    def record_success(self, key):
+        self.probing.discard(key)
+        self.failures.pop(key, None)
+        if self.opened_at.pop(key, None) is not None:
+            print(f"{key} 已恢复，关闭熔断")
+
+    def release_probe(self, key):
+        """试探请求没有结果（如被取消）时调用，下一个请求重新试探"""
+        self.probing.discard(key)
+
+    def record_failure(self, key):
+        self.probing.discard(key)
+        self.failures[key] = self.failures.get(key, 0) + 1
+        if self.failures[key] >= self.failure_threshold or key in self.opened_at:
+            if key not in self.opened_at:
+                print(f"{key} 连续失败 {self.failures[key]} 次，暂停请求 {self.reset_timeout} 秒")
+                metrics.inc('circuit_breaker_opened')
+            self.opened_at[key] = time.monotonic()
+
+    def open_keys(self):
+        """返回 {键: 剩余暂停秒数}"""
+        now = time.monotonic()
+        return {
+            key: max(0, opened_at + self.reset_timeout - now)
+            for key, opened_at in self.opened_at.items()
+        }
+
+
+class RetryPolicy:
+    """
+    指数退避 + 随机抖动的重试策略，页面抓取、视频下载和 Dropbox 调用共用
+
+    第 n 次重试前等待 [0, min(max_delay, base_delay * 2^n)] 内的随机时间（full jitter），
+    服务器给出 Retry-After 时至少等待该时间，超过 max_delay 则放弃。
+    不可重试的错误（如 404、认证失败）立即抛出；传入 breaker 时按 key 熔断。
+    """
+
+    def __init__(self, attempts=4, base_delay=1.0, max_delay=60.0, breaker=None,
+                 classify=classify_error, name='request', on_retry=None):
+        """
+        :param attempts: 最大尝试次数
+        :param base_delay: 第一次重试的最大等待时间（秒）
+        :param max_delay: 单次等待的上限（秒）
+        :param breaker: 共享的 CircuitBreaker
+        :param classify: 错误分类函数 classify(error)，返回 (是否可重试, Retry-After 秒数)
+        :param name: 指标名前缀，重试次数记录为 <name>_retries
+        :param on_retry: 每次重试前调用 on_retry(error)
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self.classify = classify
+        self.name = name
+        self.on_retry = on_retry
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        计算第 attempt 次失败后的等待时间
+        :return: 等待秒数，Retry-After 超过 max_delay 时返回 None
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+    def next_delay(self, error, attempt, key=None):
+        """
+        记录一次失败并决定是否重试
+        :return: 重试前的等待秒数，不应重试时返回 None
+        """
+        retryable, retry_after = self.classify(error)
+        if self.breaker and key is not None:
+            if retryable:
+                self.breaker.record_failure(key)
+            elif isinstance(error, RESPONSE_ERRORS):
+                # 服务器正常响应了不可重试的错误，说明主机可用；本地错误不说明主机的状态
+                self.breaker.record_success(key)
+        if not retryable or attempt == self.attempts - 1:
+            return None
+        if self.breaker and key in self.breaker.opened_at:
+            # 本次失败打开了熔断器，后续尝试会直接失败，不必等待
+            return None
+        delay = self.backoff(attempt, retry_after)
+        if delay is None:
+            return None
+        metrics.inc(f'{self.name}_retries')
+        if self.on_retry:
+            self.on_retry(error)
+        print(f"{self.name} 出错，{delay:.1f} 秒后重试 ({attempt + 1}/{self.attempts - 1}): {error}")
+        return delay
+
+    async def call(self, func, *args, key=None, **kwargs):
+        """
+        调用协程函数 func(*args, **kwargs)，失败时按策略重试
+        :param key: 熔断器的键，通常为主机名
+        """
+        for attempt in range(self.attempts):
+            probe = self.breaker.check(key) if self.breaker and key is not None else False
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self.next_delay(e, attempt, key)
+                if probe:
+                    # 本地错误既不算成功也不算失败，试探名额留给下一个请求
+                    self.breaker.release_probe(key)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            except BaseException:
+                # 被取消时既不算成功也不算失败，但不能一直占着试探名额
+                if probe:
+                    self.breaker.release_probe(key)
+                raise
+            else:
+                if self.breaker and key is not None:
+                    self.breaker.record_success(key)
+                return result
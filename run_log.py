@@ -0,0 +1,209 @@
+import glob
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+
+MiB = 1024 * 1024
+
+CURRENT = 'current.jsonl'
+LATEST = 'latest.json'
+
+
+def atomic_write_json(path, data):
+    """先写入同目录下的临时文件并落盘，再重命名覆盖，崩溃时旧文件保持完整"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class RunLog:
+    """
+    每次运行的结果记录（JSON Lines），代替每次覆盖写入的 posts.json
+
+    记录在调用方序列化为紧凑的一行，由后台线程攒批追加到 current.jsonl，事件循环不做文件 I/O。
+    文件超过 max_bytes 时轮转为 runs-<时间>.jsonl 并压缩为 .jsonl.gz，只保留最近 keep 个。
+    每次运行结束时先把日志落盘，再用临时文件 + 重命名更新 latest.json（各来源最近一次运行的摘要）。
+    进程崩溃最多丢失最后一批记录，写了一半的行在读取时跳过。
+    """
+
+    def __init__(self, directory, max_bytes=64 * MiB, keep=10, batch_size=200, flush_interval=1.0):
+        """
+        :param directory: 记录目录
+        :param max_bytes: current.jsonl 超过该大小时轮转
+        :param keep: 保留的已轮转文件数
+        :param batch_size: 每次最多合并写入的记录数
+        :param flush_interval: 没有新记录时多久写入一次已排队的记录（秒）
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.runs = {}
+        self.queue = queue.Queue()
+        os.makedirs(directory, exist_ok=True)
+        self.current_path = os.path.join(directory, CURRENT)
+        self.latest_path = os.path.join(directory, LATEST)
+        self.thread = threading.Thread(target=self._writer, name='run-log', daemon=True)
+        self.thread.start()
+
+    def start_run(self, source):
+        """
+        开始一次运行
+        :return: 运行 ID
+        """
+        now = datetime.now()
+        started_at = now.timestamp()
+        run_id = now.strftime('%Y%m%d-%H%M%S-%f')
+        self.runs[run_id] = {'source': source, 'started_at': started_at, 'posts': 0, 'videos': 0}
+        self._put({'type': 'run', 'run': run_id, 'source': source, 'started_at': started_at})
+        return run_id
+
+    def record_post(self, run_id, post_data):
+        run = self.runs[run_id]
+        run['posts'] += 1
+        run['videos'] += len(post_data.get('videos', ()))
+        self._put({'type': 'post', 'run': run_id, 'post': post_data})
+
+    def finish_run(self, run_id, stats=None, error=None):
+        """
+        结束一次运行，记录结束行并更新 latest.json
+        :param stats: 流水线的统计信息
+        :param error: 运行出错时的错误信息
+        """
+        run = self.runs.pop(run_id)
+        summary = dict(run, run=run_id, finished_at=time.time(), stats=stats, error=error)
+        self._put(dict(summary, type='end'))
+        self.queue.put(('snapshot', summary))
+
+    def _put(self, record):
+        self.queue.put(('line', json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'))
+
+    def flush(self, timeout=None):
+        """等待已排队的记录写入磁盘"""
+        done = threading.Event()
+        self.queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(('close', None))
+            self.thread.join()
+
+    def _writer(self):
+        self._compact_rotated()
+        f = self._open_current()
+        try:
+            while True:
+                try:
+                    items = [self.queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    continue
+                while len(items) < self.batch_size:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                lines = []
+                for kind, value in items:
+                    if kind == 'line':
+                        lines.append(value)
+                        continue
+                    # 快照和等待者需要看到之前的所有记录
+                    f = self._write(f, lines, sync=True)
+                    lines = []
+                    if kind == 'snapshot':
+                        self._update_latest(value)
+                    elif kind == 'flush':
+                        value.set()
+                    elif kind == 'close':
+                        return
+                f = self._write(f, lines)
+        finally:
+            f.close()
+
+    def _write(self, f, lines, sync=False):
+        """追加一批行，超过大小时轮转；返回当前打开的文件"""
+        try:
+            if lines:
+                f.write(''.join(lines))
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+            if f.tell() >= self.max_bytes:
+                f.close()
+                self._rotate()
+                f = self._open_current()
+        except OSError as e:
+            print(f"写入运行记录时出错: {e}")
+        return f
+
+    def _open_current(self):
+        f = open(self.current_path, 'a', encoding='utf-8')
+        if f.tell():
+            with open(self.current_path, 'rb') as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b'\n':
+                    # 上次崩溃时写了一半的行单独成行，不影响之后的记录
+                    f.write('\n')
+        return f
+
+    def _update_latest(self, summary):
+        try:
+            latest = self.latest()
+            latest[summary['source']] = summary
+            atomic_write_json(self.latest_path, latest)
+        except OSError as e:
+            print(f"更新运行摘要时出错: {e}")
+
+    def _rotate(self):
+        rotated = os.path.join(self.directory, f"runs-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.jsonl")
+        os.replace(self.current_path, rotated)
+        self._compact_rotated()
+
+    def _compact_rotated(self):
+        """压缩已轮转的文件（包括上次进程退出前没压缩完的），并删除超出 keep 的旧文件"""
+        for path in glob.glob(os.path.join(self.directory, 'runs-*.jsonl')):
+            tmp_path = path + '.gz.tmp'
+            with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, path + '.gz')
+            os.remove(path)
+        for path in self.segments()[:-self.keep or None]:
+            os.remove(path)
+
+    def segments(self):
+        """已轮转的文件，从旧到新"""
+        return sorted(glob.glob(os.path.join(self.directory, 'runs-*.jsonl.gz')))
+
+    def latest(self):
+        """:return: {来源: 最近一次运行的摘要}"""
+        try:
+            with open(self.latest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def iter_records(self, run_id=None):
+        """按写入顺序遍历记录，跳过无法解析的行（崩溃时写了一半的行）"""
+        paths = self.segments()
+        if os.path.exists(self.current_path):
+            paths.append(self.current_path)
+        for path in paths:
+            opener = gzip.open if path.endswith('.gz') else open
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if run_id is None or record.get('run') == run_id:
+                        yield record
@@ -0,0 +1,172 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+
+
+class PrioritySemaphore:
+    """
+    按优先级分配名额的信号量
+    有空闲名额且没有等待者时直接获得，否则优先级高（数值大）的等待者先获得，同优先级按先来后到。
+    名额总数可以通过 resize 在运行中调整
+    """
+
+    def __init__(self, value):
+        self.limit = value
+        self.value = value
+        self.waiters = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority=0):
+        if self.value > 0 and not self.waiters:
+            self.value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (-priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已经分到名额但任务被取消，把名额让给下一个等待者
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        # 缩小名额后，先归还的名额用于抵扣
+        if self.value < 0:
+            self.value += 1
+            return
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.value += 1
+
+    def resize(self, limit):
+        """调整名额总数，缩小时已占用的名额在归还时收回"""
+        difference = limit - self.limit
+        self.limit = limit
+        if difference > 0:
+            for _ in range(difference):
+                self.release()
+        else:
+            self.value += difference
+
+    def in_use(self):
+        return self.limit - self.value
+
+    @asynccontextmanager
+    async def hold(self, priority=0):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class SourceJob:
+    """一个来源（config.urls 中的一项）的调度状态"""
+
+    def __init__(self, name, url, interval_minutes=60, priority=0, download_concurrency=3):
+        self.name = name
+        self.url = url
+        self.interval_minutes = interval_minutes
+        self.priority = priority
+        self.download_concurrency = download_concurrency
+        self.next_run = time.time()
+        self.last_started = None
+        self.last_duration = None
+        self.last_error = None
+        self.task = None
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+
+class SourceScheduler:
+    """
+    每个来源作为独立的任务调度
+
+    各来源有自己的间隔和优先级，到期的来源并发运行；同一来源上一次运行还没结束时不会再次启动，
+    下一次运行时间从本次开始时间算起。
+    """
+
+    def __init__(self, run_source):
+        """
+        :param run_source: 运行一个来源的协程函数 run_source(job, **options)
+        """
+        self.run_source = run_source
+        self.jobs = {}
+
+    def update_sources(self, sources):
+        """
+        按配置新增、更新或移除来源，正在运行的来源在结束后才移除
+        :param sources: {名称: {'url', 'interval_minutes', 'priority', 'download_concurrency'}}
+        """
+        for name in list(self.jobs):
+            if name not in sources and not self.jobs[name].running:
+                del self.jobs[name]
+
+        for name, settings in sources.items():
+            job = self.jobs.get(name)
+            if job is None:
+                self.jobs[name] = SourceJob(name, **settings)
+                continue
+            if settings['interval_minutes'] != job.interval_minutes and job.last_started:
+                job.next_run = job.last_started + settings['interval_minutes'] * 60
+            job.url = settings['url']
+            job.interval_minutes = settings['interval_minutes']
+            job.priority = settings['priority']
+            job.download_concurrency = settings['download_concurrency']
+
+    def tick(self):
+        """启动所有到期且没有在运行的来源，优先级高的先启动"""
+        now = time.time()
+        due = [job for job in self.jobs.values() if job.next_run <= now and not job.running]
+        for job in sorted(due, key=lambda job: -job.priority):
+            self.start(job)
+
+    def trigger(self, name, **options):
+        """
+        立即运行一个来源
+        :return: 来源正在运行时返回 False
+        """
+        job = self.jobs[name]
+        if job.running:
+            return False
+        self.start(job, **options)
+        return True
+
+    def start(self, job, **options):
+        job.last_started = time.time()
+        job.next_run = job.last_started + job.interval_minutes * 60
+        job.task = asyncio.create_task(self._run(job, options))
+
+    def running_jobs(self):
+        return [job for job in self.jobs.values() if job.running]
+
+    async def _run(self, job, options):
+        try:
+            await self.run_source(job, **options)
+            job.last_error = None
+        except Exception as e:
+            job.last_error = str(e)
+            print(f"来源 {job.name} 运行出错: {e}")
+        finally:
+            job.last_duration = time.time() - job.last_started
+
+    async def stop(self):
+        """取消所有正在运行的来源"""
+        tasks = [job.task for job in self.running_jobs()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,65 +1,147 @@
 import time
 import os
 import random
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
-from bs4 import BeautifulSoup
-import json
 from datetime import datetime
-import aiohttp
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl, urlencode
 import asyncio
+import hashlib
+from fetcher import HttpFetcher, SeleniumFetcher, FallbackFetcher, NOT_MODIFIED, classify_browser_error
+from http_session import SessionManager
+from downloader import SegmentedDownloader
+from driver_pool import DriverPool
+from history import HistoryStore
+from job_queue import JobQueue, DOWNLOADING, DOWNLOADED, UPLOADING, SYNCED, FAILED
+from staging import StagingArea, InsufficientSpaceError, GiB
+from run_log import RunLog
+from dedup import DedupIndex, HashCatalog
+from metrics import metrics
+from retry import RetryPolicy, CircuitBreaker
+from page_parser import parse_post_cards, parse_video_links
 
 class CoomerScraper:
-    def __init__(self):
+    def __init__(self, fetch_mode='http', per_host_limit=4, post_concurrency=4, hash_catalog=None, data_dir=None,
+                 browser_pool_size=2, browser_max_pages=50, browser_max_memory_mb=1024, max_listing_pages=10,
+                 download_concurrency=3, download_slots=None, limiter=None, controller=None,
+                 retry_attempts=4, retry_max_delay=60, preallocate_downloads=True,
+                 staging_quota_gb=10, min_free_disk_gb=2):
+        """
+        :param fetch_mode: 'http' 优先使用 aiohttp 抓取，失败时回退到浏览器；'browser' 始终使用浏览器
+        :param per_host_limit: HTTP 抓取时每个主机的最大并发请求数
+        :param post_concurrency: 同时解析的帖子详情页数量
+        :param hash_catalog: 共享的 HashCatalog，为 None 时使用默认路径创建
+        :param data_dir: 下载目录和历史记录所在目录，默认为项目目录
+        :param browser_pool_size: 浏览器抓取时的最大 WebDriver 实例数
+        :param browser_max_pages: 每个 WebDriver 加载多少个页面后回收
+        :param browser_max_memory_mb: WebDriver 内存超过该值（MB）时回收
+        :param max_listing_pages: 每个列表页 URL 最多向后翻的页数
+        :param download_concurrency: download_all_videos 的同时下载数
+        :param download_slots: 共享的下载名额（PrioritySemaphore），设置时代替 download_concurrency
+        :param limiter: 与 Dropbox 上传共享的 TokenBucket 限速器
+        :param controller: AdaptiveConcurrency，记录下载结果用于调整并发数
+        :param retry_attempts: 页面请求和下载分段的最大尝试次数
+        :param retry_max_delay: 两次尝试之间的最长等待时间（秒），Retry-After 超过该值时放弃
+        :param preallocate_downloads: 下载前是否用 posix_fallocate 分配磁盘空间
+        :param staging_quota_gb: 下载目录最多占用的空间（GB），0 表示不限制
+        :param min_free_disk_gb: 磁盘至少保留的剩余空间（GB），不足时暂停下载
+        """
+        data_dir = data_dir or os.path.dirname(os.path.abspath(__file__))
         self.base_url = "https://coomer.su"
         self.popular_url = urljoin(self.base_url, "/posts/popular")
-        self.setup_driver()
-        self.download_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'downloads')
+        self.download_dir = os.path.join(data_dir, 'downloads')
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir)
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        self.history_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scraped_posts.json')
-        self.scraped_posts = self.load_scraped_posts()
-        self.max_concurrent_downloads = 3
+        self.history_file = os.path.join(data_dir, 'scraped_posts.json')
+        self.history_db = os.path.join(data_dir, 'scraped_posts.db')
+        self.history = self.load_history()
+        # 视频任务和爬取历史在同一个数据库中，重启后未完成的下载和上传从这里继续
+        # 任务和下载目录状态的更新立即提交，各用一个连接，不影响历史记录的批量提交
+        self.jobs = JobQueue(self.history.connect())
+        # 已上传的文件保留在本地，空间不足时按最近使用时间删除
+        self.staging = StagingArea(
+            self.download_dir, self.history.connect(),
+            quota=int(staging_quota_gb * GiB), min_free=int(min_free_disk_gb * GiB)
+        )
+        self.dedup = DedupIndex.from_history(self.history)
+        # 每次运行解析到的帖子追加到 runs/ 下的 JSON Lines 记录
+        self.run_log = RunLog(os.path.join(data_dir, 'runs'))
+        self.hash_catalog = hash_catalog or HashCatalog(os.path.join(data_dir, 'content_hashes.db'))
+        self.max_concurrent_downloads = download_concurrency
+        self.download_slots = download_slots
+        self.controller = controller
+        self.max_concurrent_posts = post_concurrency
+        self.max_listing_pages = max_listing_pages
+        self.retry_attempts = retry_attempts
+        self.retry_max_delay = retry_max_delay
+        # 页面抓取和视频下载按主机共用熔断器
+        self.breaker = CircuitBreaker(failure_threshold=8, reset_timeout=30)
+        # 页面抓取和视频下载共享同一个连接池
+        self.sessions = SessionManager(headers=self.headers)
+        self.downloader = SegmentedDownloader(
+            self.sessions, limiter=limiter, controller=controller,
+            retry=self.retry_policy('download', on_retry=self.record_download_retry),
+            fallocate=preallocate_downloads,
+            staging=self.staging
+        )
+        # 第一次需要浏览器时才启动 Chrome，实例在多次运行之间保留
+        self.driver_pool = DriverPool(
+            self.setup_driver,
+            size=browser_pool_size,
+            max_pages=browser_max_pages,
+            max_memory_mb=browser_max_memory_mb
+        )
+        self.fetcher = self.setup_fetcher(fetch_mode, per_host_limit)
 
-    def load_scraped_posts(self):
-        try:
-            if os.path.exists(self.history_file):
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
-        except Exception as e:
-            print(f"加载历史记录时出错: {e}")
-            return {}
+    def retry_policy(self, name, **kwargs):
+        return RetryPolicy(
+            attempts=self.retry_attempts, max_delay=self.retry_max_delay, breaker=self.breaker, name=name, **kwargs
+        )
 
-    def save_scraped_posts(self):
-        try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.scraped_posts, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"保存历史记录时出错: {e}")
+    def record_download_retry(self, error):
+        # 重试前的失败同样计入自适应并发的统计，429/503 会立即降低并发数
+        if self.controller:
+            self.controller.record_failure(getattr(error, 'status', None))
 
-    def is_post_scraped(self, post_id, post_data):
-        if post_id in self.scraped_posts:
-            old_videos = set(v['filename'] for v in self.scraped_posts[post_id].get('videos', []))
-            new_videos = set(v['filename'] for v in post_data.get('videos', []))
-            if old_videos == new_videos:
-                return True
-        return False
+    def setup_fetcher(self, fetch_mode, per_host_limit):
+        # 浏览器加载较慢，第一次重试前最多等待 5 秒
+        browser_retry = self.retry_policy('page_fetch', base_delay=5, classify=classify_browser_error)
+        browser_fetcher = SeleniumFetcher(self.driver_pool, self.get_page_content, retry=browser_retry)
+        if fetch_mode == 'browser':
+            return browser_fetcher
+        http_fetcher = HttpFetcher(self.sessions, per_host_limit=per_host_limit, retry=self.retry_policy('page_fetch'))
+        return FallbackFetcher(http_fetcher, browser_fetcher)
+
+    def load_history(self):
+        history = HistoryStore(self.history_db)
+        # 首次使用 SQLite 时导入旧的 JSON 历史记录
+        history.migrate_from_json(self.history_file)
+        return history
+
+    def is_post_scraped(self, post_id, post_data=None):
+        return self.dedup.is_post_scraped(post_id, post_data)
 
     def add_to_scraped_posts(self, post_id, post_data):
-        self.scraped_posts[post_id] = post_data
-        self.save_scraped_posts()
+        self.history.add_post(post_id, post_data)
+        self.dedup.add_post(post_id, post_data)
+
+    def filter_new_videos(self, post_id, video_links):
+        """过滤掉已在其他帖子中记录过的视频（URL 路径相同）"""
+        new_videos = []
+        for video in video_links:
+            location = self.dedup.find_video(video)
+            if location is not None and location != post_id:
+                print(f"视频 {video['filename']} 已在帖子 {location} 中下载过，跳过")
+                continue
+            new_videos.append(video)
+        return new_videos
 
     def setup_driver(self):
+        """创建一个 WebDriver，由 DriverPool 在线程池中调用"""
+        # selenium 导入较慢，第一次需要浏览器时才在线程池中导入
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
         options = Options()
         options.add_argument('--headless=new')
         options.add_argument('--no-sandbox')
@@ -69,180 +151,328 @@ class CoomerScraper:
         options.add_argument('--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
         options.add_argument('--disable-blink-features=AutomationControlled')
         
-        self.driver = webdriver.Chrome(options=options)
-        self.driver.execute_cdp_cmd('Network.setUserAgentOverride', {
+        driver = webdriver.Chrome(options=options)
+        driver.execute_cdp_cmd('Network.setUserAgentOverride', {
             "userAgent": 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        return driver
 
     def random_sleep(self, min_seconds=2, max_seconds=5):
         time.sleep(random.uniform(min_seconds, max_seconds))
 
-    def get_page_content(self, url, retries=3):
-        for attempt in range(retries):
-            try:
-                print(f"Fetching content from {url}... (Attempt {attempt + 1}/{retries})")
-                self.driver.get(url)
-                
-                WebDriverWait(self.driver, 15).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-                
-                self.random_sleep()
-                
-                print("Page loaded successfully")
-                return self.driver.page_source
-            except (TimeoutException, WebDriverException) as e:
-                print(f"Error on attempt {attempt + 1}: {e}")
-                if attempt < retries - 1:
-                    self.random_sleep(5, 10)
-                    continue
-                else:
-                    print(f"Failed to fetch page after {retries} attempts")
-                    return None
-            except Exception as e:
-                print(f"Unexpected error: {e}")
-                return None
+    def get_page_content(self, driver, url):
+        """用指定的 WebDriver 加载页面，在线程池中执行，重试由 SeleniumFetcher 负责"""
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        driver.get(url)
+        
+        WebDriverWait(driver, 15).until(
+            EC.presence_of_element_located((By.TAG_NAME, "body"))
+        )
+        
+        self.random_sleep()
+        
+        print("Page loaded successfully")
+        return driver.page_source
+
+    async def fetch_page(self, url, expect=None, validators=None):
+        """
+        通过当前抓取器获取页面，expect 为页面中应包含的标记
+        :param validators: 上次响应的 {'etag', 'last_modified'}，传入时发送条件请求，并用本次响应的值更新
+        :return: HTML 文本；页面未变化时返回 NOT_MODIFIED，失败时返回 None
+        """
+        with metrics.timer('page_fetch_seconds'):
+            if validators is None:
+                html_content = await self.fetcher.fetch(url, expect)
+            else:
+                html_content, new_validators = await self.fetcher.fetch_conditional(url, expect, validators)
+                if new_validators and html_content is not NOT_MODIFIED:
+                    validators.update(new_validators)
+        if html_content is NOT_MODIFIED:
+            metrics.inc('pages_not_modified')
+            return html_content
+        metrics.inc('pages_fetched' if html_content else 'page_fetch_failures')
+        return html_content
 
     async def run_async(self, url, callback=None):
         print("开始爬取过程...")
-        html_content = self.get_page_content(url)
-        if html_content:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            posts = soup.find_all('article', class_=['post-card', 'post-card--preview'])
-            
+        run_id = self.run_log.start_run(url)
+        parsed_posts = []
+        try:
+            async for post_data in self.iter_posts(url, callback):
+                parsed_posts.append(post_data)
+                self.run_log.record_post(run_id, post_data)
+        except Exception as e:
+            self.run_log.finish_run(run_id, error=str(e))
+            raise
+        self.run_log.finish_run(run_id)
+        return parsed_posts
+
+    def listing_page_url(self, url, offset):
+        """列表页第 offset 个帖子开始的分页地址（?o=）"""
+        if not offset:
+            return url
+        parts = urlparse(url)
+        query = [(key, value) for key, value in parse_qsl(parts.query) if key != 'o']
+        query.append(('o', str(offset)))
+        return urlunparse(parts._replace(query=urlencode(query)))
+
+    def is_known_post(self, post, newest_timestamp, newest_first):
+        """
+        帖子是否已处理过
+        列表按时间从新到旧排列时，不晚于上次运行记录的最新帖子（newest_timestamp）也视为已知
+        """
+        if post.post_id and self.dedup.is_post_scraped(post.post_id):
+            return True
+        return bool(newest_first and newest_timestamp and post.timestamp and post.timestamp <= newest_timestamp)
+
+    def is_newest_first(self, posts):
+        timestamps = [post.timestamp for post in posts]
+        return all(timestamps) and all(a >= b for a, b in zip(timestamps, timestamps[1:]))
+
+    def update_high_water_mark(self, state, posts):
+        """记录见过的最新帖子"""
+        for post in posts:
+            if post.timestamp and post.timestamp > (state.get('newest_timestamp') or ''):
+                state['newest_timestamp'] = post.timestamp
+                state['newest_post_id'] = post.post_id
+
+    async def fetch_listing_page(self, url, state, first_page=False, conditional=False):
+        """
+        抓取并解析一页列表
+        :param first_page: 第一页必须包含帖子卡片，之后的页面可以为空（已翻到末尾）
+        :param conditional: 是否使用 state 中的 ETag/Last-Modified 发送条件请求
+        :return: PostCard 列表，页面未变化或没有帖子时为空列表，抓取失败时为 None
+        """
+        html_content = await self.fetch_page(
+            url,
+            expect='post-card' if first_page else None,
+            validators=state if conditional else None
+        )
+        if html_content is NOT_MODIFIED:
+            print(f"列表页未变化: {url}")
+            return []
+        if not html_content:
+            return None
+        with metrics.timer('html_parse_seconds'):
+            return parse_post_cards(html_content)
+
+    async def iter_posts(self, url, callback=None, backfill=False, max_pages=None):
+        """
+        逐页抓取列表页（?o= 偏移）并并发解析帖子详情，按完成顺序逐个产出帖子数据
+
+        第一页使用条件请求，未变化时直接结束；某一页的帖子全部已知时不再向后翻页。
+        backfill 为 True 时两者都不生效，一直翻到没有帖子或达到 max_pages 页。
+        :param max_pages: 最多抓取的页数，默认为 max_listing_pages
+        """
+        state = self.history.get_crawl_state(url) or {}
+        previous_newest = state.get('newest_timestamp')
+        previous_post_id = state.get('newest_post_id')
+        incomplete = False
+        max_pages = max_pages or self.max_listing_pages
+        offset = 0
+        page_size = None
+        total = 0
+        completed = 0
+        for page in range(1, max_pages + 1):
+            page_url = self.listing_page_url(url, offset)
+            posts = await self.fetch_listing_page(
+                page_url, state, first_page=page == 1, conditional=page == 1 and not backfill
+            )
+            if posts is None:
+                # 没有抓完，下次运行不发送条件请求
+                state['etag'] = state['last_modified'] = None
+                break
+            if not posts:
+                break
+            metrics.inc('listing_pages')
+            # 在处理之前判断，处理后所有帖子都会变成已知
+            newest_first = self.is_newest_first(posts)
+            all_known = all(self.is_known_post(post, previous_newest, newest_first) for post in posts)
+
+            total += len(posts)
             if callback:
-                await callback.on_scraping_start(len(posts))
-            
-            parsed_posts = []
-            skipped_posts = 0
-            
-            for i, post in enumerate(posts, 1):
-                post_data = await self.process_post(post, i, len(posts), callback)
+                await callback.on_scraping_start(total)
+
+            async for post_data in self.process_posts(posts, total - len(posts), total, callback, source=url):
+                completed += 1
+                if callback:
+                    await callback.on_post_processed(completed, skipped=post_data is None)
                 if post_data:
-                    parsed_posts.append(post_data)
-            
-            self.save_results(parsed_posts)
-            return parsed_posts
-        return []
+                    yield post_data
 
-    async def process_post(self, post, current_num, total_posts, callback=None):
+            # 详情页抓取失败的帖子没有记录，仍是未知帖子
+            if any(post.post_id and not self.dedup.is_post_scraped(post.post_id) for post in posts):
+                incomplete = True
+            self.update_high_water_mark(state, posts)
+            if all_known and not backfill:
+                print(f"第 {page} 页的帖子都已处理过，停止翻页")
+                break
+            # 不满一页说明已经是最后一页
+            page_size = page_size or len(posts)
+            if len(posts) < page_size:
+                break
+            offset += len(posts)
+
+        if incomplete:
+            # 有帖子没有处理成功：不推进最新帖子标记，也不发送条件请求，下次运行重新翻到这些帖子
+            state['etag'] = state['last_modified'] = None
+            state['newest_timestamp'] = previous_newest
+            state['newest_post_id'] = previous_post_id
+        # 全部处理完才保存，中途失败时下次运行不会因为 304 而跳过
+        self.history.set_crawl_state(url, state)
+
+    async def process_posts(self, posts, first_num, total_posts, callback=None, source=None):
+        """
+        并发解析一页中的帖子详情，按完成顺序逐个产出帖子数据，已处理过的帖子产出 None
+        :param source: 帖子所属的列表页 URL，记录在视频任务中
+        """
+        # 最多同时解析 max_concurrent_posts 个帖子，消费者取走结果后才开始新的帖子，
+        # 下游处理变慢时抓取也随之暂停
+        remaining = iter(enumerate(posts, first_num + 1))
+        pending = set()
+
+        def fill():
+            for current_num, post in remaining:
+                pending.add(asyncio.create_task(
+                    self.process_post(post, current_num, total_posts, callback, source)
+                ))
+                if len(pending) >= self.max_concurrent_posts:
+                    break
+
+        fill()
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+                fill()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def process_post(self, post, current_num, total_posts, callback=None, source=None):
+        """
+        :param post: 列表页解析出的 PostCard
+        :param source: 帖子所属的列表页 URL
+        """
         print(f"\n处理帖子 {current_num}/{total_posts}")
-        post_data = {
-            'post_id': post.get('data-id'),
-            'service': post.get('data-service'),
-            'user_id': post.get('data-user'),
-            'url': post.find('a', class_='fancy-link')['href'] if post.find('a', class_='fancy-link') else None,
-            'timestamp': None,
-            'favorites': None,
-            'attachments': None,
-            'videos': []
-        }
+        post_data = post.to_dict()
+        post_data['videos'] = []
 
         if post_data['post_id'] and self.is_post_scraped(post_data['post_id'], post_data):
             print(f"帖子 {post_data['post_id']} 已爬取过，跳过")
-            if callback:
-                await callback.on_post_processed(current_num, skipped=True)
             return None
 
-        timestamp_elem = post.find('time', class_='timestamp')
-        if timestamp_elem:
-            post_data['timestamp'] = timestamp_elem['datetime']
-
-        footer_div = post.find('footer').find('div').find('div')
-        if footer_div:
-            text = footer_div.get_text(separator='\n').strip()
-            lines = [line.strip() for line in text.split('\n') if line.strip()]
-            
-            for line in lines:
-                if 'attachments' in line.lower():
-                    post_data['attachments'] = line.split(' ')[0]
-                elif 'favorites' in line.lower():
-                    post_data['favorites'] = line.split(' ')[0]
-
         if post_data['url']:
-            video_links = self.get_video_links(post_data['url'])
+            video_links = await self.get_video_links(post_data['url'])
+            if video_links is None:
+                # 不记录帖子，下次运行重新抓取，否则它的视频会被当作已处理而永远跳过
+                print(f"帖子 {post_data['post_id']} 的详情页抓取失败，下次运行重试")
+                return None
+            video_links = self.filter_new_videos(post_data['post_id'], video_links)
             post_data['videos'] = video_links
             
             if callback and video_links:
                 await callback.on_video_found(len(video_links))
 
+        # 先登记视频任务再记录帖子，帖子记录丢失时重新解析，已登记的任务保持原状态
+        self.jobs.add_videos(post_data['post_id'], post_data['videos'], source)
         if post_data['post_id']:
             self.add_to_scraped_posts(post_data['post_id'], post_data)
 
-        if callback:
-            await callback.on_post_processed(current_num)
-
         return post_data
 
-    def get_video_links(self, post_url):
+    async def get_video_links(self, post_url):
+        """:return: 视频链接列表，帖子页抓取失败时返回 None"""
         try:
             full_url = urljoin(self.base_url, post_url)
-            html_content = self.get_page_content(full_url)
-            if not html_content:
-                return []
+            with metrics.timer('post_resolve_seconds'):
+                html_content = await self.fetch_page(full_url, expect='post__')
+                if not html_content:
+                    return None
 
-            soup = BeautifulSoup(html_content, 'html.parser')
-            video_links = []
-            
-            for link in soup.find_all('a', class_='post__attachment-link'):
-                href = link.get('href')
-                if href and any(ext in href.lower() for ext in ['.mp4', '.mov', '.avi', '.wmv', '.flv']):
-                    filename = link.get('download') or os.path.basename(href)
-                    video_links.append({
-                        'url': href,
-                        'filename': filename
-                    })
+                with metrics.timer('html_parse_seconds'):
+                    video_links = [link.to_dict() for link in parse_video_links(html_content)]
             
             print(f"Found {len(video_links)} video links")
             return video_links
         except Exception as e:
             print(f"Error getting video links: {e}")
-            return []
+            return None
 
     async def download_video(self, url, filename, callback=None, dropbox_sync=None):
         try:
             print(f"正在下载视频: {filename}")
+            self.jobs.set_state(url, DOWNLOADING)
             
             file_path = os.path.join(self.download_dir, filename)
             
-            async with aiohttp.ClientSession(headers=self.headers) as session:
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        raise aiohttp.ClientResponseError(
-                            response.request_info,
-                            response.history,
-                            status=response.status
-                        )
-                    
-                    file_size = int(response.headers.get('content-length', 0))
-                    
-                    with open(file_path, 'wb') as f:
-                        downloaded = 0
-                        async for chunk in response.content.iter_chunked(32768):  
-                            if chunk:
-                                f.write(chunk)
-                                downloaded += len(chunk)
-                                progress = (downloaded / file_size) * 100 if file_size > 0 else 0
-                                if callback:
-                                    await callback.on_video_download_progress(filename, progress)
-            
-            print(f"视频已保存到 {file_path}")
+            async def report_progress(downloaded, file_size):
+                if callback:
+                    progress = (downloaded / file_size) * 100 if file_size > 0 else 0
+                    await callback.on_video_download_progress(filename, progress)
+
+            start = time.perf_counter()
+            size, sha256 = await self.downloader.download(url, file_path, report_progress, hashlib.sha256())
+            elapsed = time.perf_counter() - start
+            metrics.observe('download_seconds', elapsed)
+            metrics.inc('download_bytes', size)
+            if elapsed > 0:
+                metrics.observe('download_bytes_per_second', size / elapsed)
+            if self.controller:
+                self.controller.record_success()
             
             if callback:
                 await callback.on_video_downloaded(filename)
+
+            # 内容与已下载过的文件相同时不保留、不上传
+            fingerprint = await self.hash_catalog.fingerprint(file_path, sha256)
+            duplicate = await self.hash_catalog.find_duplicate(file_path, fingerprint)
+            if duplicate:
+                print(f"视频 {filename} 与 {duplicate['filename']} 内容相同，跳过")
+                os.remove(file_path)
+                self.jobs.set_state(url, SYNCED, f"与 {duplicate['filename']} 内容相同")
+                return True
+            self.hash_catalog.add(file_path, fingerprint)
+            self.staging.add(filename)
+            self.jobs.set_state(url, DOWNLOADED)
+            
+            print(f"视频已保存到 {file_path}")
             
-            if dropbox_sync and dropbox_sync.auto_sync:
+            if dropbox_sync:
                 print(f"正在同步到 Dropbox: {filename}")
-                success = await dropbox_sync.upload_file(file_path, callback)
-                if success:
-                    print(f"删除本地文件: {filename}")
-                    os.remove(file_path)
+                await self.sync_video({'url': url, 'filename': filename}, dropbox_sync, callback)
             
             return True
         except Exception as e:
             print(f"下载视频时出错: {e}")
+            self.jobs.set_state(url, FAILED, str(e))
+            metrics.inc('downloads_failed')
+            if self.controller:
+                # aiohttp.ClientResponseError 带有响应状态码，429/503 会让并发数减半
+                self.controller.record_failure(getattr(e, 'status', None))
+            if callback:
+                await callback.on_video_failed(filename)
+            return False
+
+    async def sync_video(self, video, dropbox_sync, callback=None):
+        """
+        上传已下载的视频，成功后本地文件标记为可删除，目录超出配额时删除最久未使用的已上传文件
+        :return: 是否成功
+        """
+        file_path = os.path.join(self.download_dir, video['filename'])
+        self.jobs.set_state(video['url'], UPLOADING)
+        success = await dropbox_sync.upload_file(file_path, callback.on_video_synced if callback else None)
+        if not success:
+            self.jobs.set_state(video['url'], FAILED, "上传失败")
             return False
+        self.jobs.set_state(video['url'], SYNCED)
+        self.staging.mark_synced(video['filename'])
+        self.staging.trim()
+        return True
 
     async def download_all_videos(self, posts, callback=None, dropbox_sync=None):
         total_videos = sum(len(post['videos']) for post in posts)
@@ -261,8 +491,17 @@ class CoomerScraper:
             for video in post['videos']:
                 tasks.append(self.download_video(video['url'], video['filename'], callback, dropbox_sync))
 
-        semaphore = asyncio.Semaphore(self.max_concurrent_downloads)
+        # 不上传时下载的文件不会变为可删除，下载目录不按配额限制
+        self.staging.uploads = dropbox_sync is not None
+        semaphore = self.download_slots or asyncio.Semaphore(self.max_concurrent_downloads)
         async def download_with_semaphore(task):
+            # 先等空间再占名额，下载目录已满时不占着全局名额等待
+            try:
+                await self.staging.wait_for_space()
+            except InsufficientSpaceError as e:
+                print(f"下载视频时出错: {e}")
+                task.close()
+                return False
             async with semaphore:
                 return await task
 
@@ -271,30 +510,30 @@ class CoomerScraper:
         downloaded = sum(1 for result in results if result)
         print(f"\n下载完成! 成功下载 {downloaded}/{total_videos} 个视频")
 
-    def save_results(self, posts, filename='posts.json'):
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(posts, f, indent=2, ensure_ascii=False)
-            print(f"Results saved to {filename}")
-
     async def run(self):
-        print("开始爬取过程...")
-        html_content = self.get_page_content(self.popular_url)
-        if html_content:
+        try:
             posts = await self.run_async(self.popular_url)
             print(f"\n找到 {len(posts)} 个帖子")
             
             await self.download_all_videos(posts)
             
             return posts
-        return []
+        finally:
+            await self.close()
+
+    async def cleanup(self):
+        """每次运行结束时调用，WebDriver 池保留供下次运行使用"""
+        self.history.flush()
+        await self.fetcher.close()
+        await self.sessions.close()
 
-    def cleanup(self):
-        if hasattr(self, 'driver'):
-            self.driver.quit()
+    async def close(self):
+        """退出前调用，关闭所有 WebDriver"""
+        await self.cleanup()
+        await self.driver_pool.close()
+        self.downloader.close()
+        self.run_log.close()
 
 if __name__ == "__main__":
     scraper = CoomerScraper()
-    try:
-        results = asyncio.run(scraper.run())
-    finally:
-        scraper.cleanup()
+    results = asyncio.run(scraper.run())
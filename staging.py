@@ -0,0 +1,246 @@
+import asyncio
+import os
+import shutil
+import time
+
+# 暂存文件的状态
+PENDING = 'pending'  # 等待上传
+SYNCED = 'synced'  # 已上传，空间不足时可以删除
+PINNED = 'pinned'  # 手动固定（与上传状态无关），不会被删除
+
+GiB = 1024 ** 3
+
+
+class InsufficientSpaceError(Exception):
+    """不上传时磁盘剩余空间不足，没有可以腾出的空间"""
+
+
+class StagingArea:
+    """
+    下载目录的空间管理
+
+    目录占用（包括下载中的 .part 文件）不超过 quota 字节，磁盘剩余空间不低于 min_free 字节。
+    新下载开始前先申请空间：不够时按最近使用时间从旧到新删除已上传的文件，
+    仍然不够时暂停，直到上传完成或文件被删除后腾出空间。
+    不上传（uploads 为 False）时文件只在本地保存，不受配额限制，磁盘空间不足时直接失败而不是等待。
+    文件状态保存在爬取历史数据库的 staged_files 表中。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS staged_files (
+            filename TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            pinned INTEGER NOT NULL DEFAULT 0,
+            size INTEGER,
+            last_used REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_staged_files_state ON staged_files(state, last_used);
+    """
+
+    def __init__(self, directory, conn, quota=10 * GiB, min_free=2 * GiB, recheck_interval=30, uploads=True):
+        """
+        :param directory: 下载目录
+        :param conn: 爬取历史数据库的 sqlite3 连接（HistoryStore.connect()），不与 HistoryStore 共用
+        :param quota: 目录最多占用的字节数，0 表示不限制
+        :param min_free: 磁盘至少保留的剩余字节数
+        :param recheck_interval: 暂停下载时多久重新检查一次空间（秒），其他程序也可能释放空间
+        :param uploads: 下载的文件是否会上传，运行中可修改
+        """
+        self.directory = directory
+        self.conn = conn
+        self.quota = quota
+        self.min_free = min_free
+        self.recheck_interval = recheck_interval
+        self.uploads = uploads
+        # 已获准、但还没有在磁盘上分配的字节数
+        self.reserved = 0
+        self.waiting = 0
+        self._space_freed = None
+        self.conn.executescript(self.SCHEMA)
+        self.reconcile()
+
+    def reconcile(self):
+        """启动时与磁盘同步：删除已不存在的记录，登记未记录的文件为等待上传"""
+        on_disk = {entry.name: entry.stat() for entry in self.scan()}
+        known = {filename for (filename,) in self.conn.execute('SELECT filename FROM staged_files')}
+        with self.conn:
+            self.conn.executemany(
+                'DELETE FROM staged_files WHERE filename = ?',
+                [(filename,) for filename in known - set(on_disk)]
+            )
+            self.conn.executemany(
+                'INSERT INTO staged_files (filename, state, size, last_used) VALUES (?, ?, ?, ?)',
+                [
+                    (filename, PENDING, stat.st_size, stat.st_mtime)
+                    for filename, stat in on_disk.items()
+                    if filename not in known and not _is_partial(filename)
+                ]
+            )
+
+    def scan(self):
+        """遍历下载目录中的文件"""
+        with os.scandir(self.directory) as entries:
+            return [entry for entry in entries if entry.is_file()]
+
+    def usage(self):
+        """下载目录当前占用的字节数"""
+        return sum(entry.stat().st_size for entry in self.scan())
+
+    def free_space(self):
+        return shutil.disk_usage(self.directory).free
+
+    def shortfall(self, size):
+        """再写入 size 字节还差多少空间，0 表示足够"""
+        missing = self.min_free + self.reserved + size - self.free_space()
+        # 不上传时没有文件会变为可删除，配额只会让下载永远等待
+        if self.quota and self.uploads:
+            # 单个文件超过配额时，等目录中的其他文件腾出后仍允许下载
+            limit = max(self.quota, size)
+            missing = max(missing, self.usage() + self.reserved + size - limit)
+        return max(0, missing)
+
+    async def admit(self, size):
+        """
+        为即将下载的 size 字节申请空间，不够时先删除已上传的文件，仍然不够则等待
+        获准后调用 release(size)（文件已分配空间或下载失败时）
+        """
+        await self.wait_for_space(size)
+        self.reserved += size
+
+    async def wait_for_space(self, size=0):
+        """
+        等待目录中有 size 字节的空间，不预留
+        下载在占用全局下载名额之前先调用，空间不足的来源不会占着名额等待
+        :raises InsufficientSpaceError: 不上传且磁盘空间不足时
+        """
+        paused = False
+        try:
+            while True:
+                missing = self.shortfall(size)
+                # 删除所有可删除的文件也不够时先不删，等上传完成后一次腾出
+                if missing and self.reclaimable() >= missing:
+                    missing -= self.evict(missing)
+                if not missing:
+                    break
+                if not self.uploads and self.reclaimable() < missing:
+                    raise InsufficientSpaceError(f"磁盘剩余空间不足（还差 {missing / GiB:.2f} GB），且没有可删除的已上传文件")
+                if not paused:
+                    paused = True
+                    self.waiting += 1
+                    print(f"下载目录空间不足（还差 {missing / GiB:.2f} GB），暂停新的下载")
+                try:
+                    await asyncio.wait_for(self.space_freed().wait(), self.recheck_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if paused:
+                print("空间已足够，继续下载")
+        finally:
+            if paused:
+                self.waiting -= 1
+
+    def release(self, size):
+        self.reserved -= size
+        self.notify()
+
+    def space_freed(self):
+        # 在事件循环中创建
+        if self._space_freed is None:
+            self._space_freed = asyncio.Event()
+        return self._space_freed
+
+    def notify(self):
+        """有空间释放或有文件变为可删除时唤醒等待的下载"""
+        if self._space_freed is not None:
+            self._space_freed.set()
+            self._space_freed = None
+
+    def add(self, filename, state=PENDING):
+        """登记下载完成的文件"""
+        path = os.path.join(self.directory, filename)
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO staged_files (filename, state, size, last_used) VALUES (?, ?, ?, ?)',
+                (filename, state, os.path.getsize(path), time.time())
+            )
+
+    def mark_synced(self, filename):
+        """文件已上传，之后可以被删除；同时刷新最近使用时间"""
+        self._update(filename, 'state = ?, last_used = ?', (SYNCED, time.time()))
+        self.notify()
+
+    def pin(self, filename, pinned=True):
+        """
+        固定或取消固定文件，固定的文件不会被删除
+        :return: 文件是否有记录
+        """
+        updated = self._update(filename, 'pinned = ?', (int(pinned),))
+        if not pinned:
+            self.notify()
+        return updated
+
+    def _update(self, filename, assignments, params):
+        with self.conn:
+            return bool(self.conn.execute(
+                f"UPDATE staged_files SET {assignments} WHERE filename = ?", (*params, filename)
+            ).rowcount)
+
+    def remove(self, filename):
+        """删除文件及其记录"""
+        path = os.path.join(self.directory, filename)
+        if os.path.exists(path):
+            os.remove(path)
+        with self.conn:
+            self.conn.execute('DELETE FROM staged_files WHERE filename = ?', (filename,))
+        self.notify()
+
+    def reclaimable(self):
+        """可以删除的（已上传且未固定的）文件合计字节数"""
+        (total,) = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM staged_files WHERE state = ? AND pinned = 0', (SYNCED,)
+        ).fetchone()
+        return total
+
+    def evict(self, needed):
+        """
+        按最近使用时间从旧到新删除已上传的文件，直到释放 needed 字节
+        :return: 实际释放的字节数
+        """
+        freed = 0
+        rows = self.conn.execute(
+            'SELECT filename FROM staged_files WHERE state = ? AND pinned = 0 ORDER BY last_used', (SYNCED,)
+        ).fetchall()
+        for (filename,) in rows:
+            if freed >= needed:
+                break
+            path = os.path.join(self.directory, filename)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            self.remove(filename)
+            freed += size
+            print(f"删除已上传的本地文件: {filename}")
+        return freed
+
+    def trim(self):
+        """上传完成后调用，目录超出配额或磁盘空间不足时删除已上传的文件"""
+        missing = self.shortfall(0)
+        if missing:
+            self.evict(missing)
+
+    def summary(self):
+        """:return: {'usage', 'quota', 'free', 'waiting', 各状态的文件数}"""
+        counts = dict(self.conn.execute(
+            "SELECT CASE WHEN pinned THEN 'pinned' ELSE state END, COUNT(*) FROM staged_files GROUP BY 1"
+        ))
+        return {
+            'usage': self.usage(),
+            'quota': self.quota,
+            'uploads': self.uploads,
+            'free': self.free_space(),
+            'waiting': self.waiting,
+            PENDING: counts.get(PENDING, 0),
+            SYNCED: counts.get(SYNCED, 0),
+            PINNED: counts.get(PINNED, 0)
+        }
+
+
+def _is_partial(filename):
+    return filename.endswith(('.part', '.part.json', '.part.json.tmp'))